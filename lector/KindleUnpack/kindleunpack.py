@@ -18,6 +18,7 @@ from .compatibility_utils import hexlify
 
 add_cp65001_codec()
 
+from . import unipath
 from .unipath import pathof
 
 if PY2:
@@ -202,7 +203,7 @@ def processSRCS(i, files, rscnames, sect, data):
     # extract the source zip archive and save it.
     print("File contains kindlegen source archive, extracting as %s" % KINDLEGENSRC_FILENAME)
     srcname = os.path.join(files.outdir, KINDLEGENSRC_FILENAME)
-    with open(pathof(srcname), 'wb') as f:
+    with unipath.open(pathof(srcname), 'wb') as f:
         f.write(data[16:])
     rscnames.append(None)
     sect.setsectiondescription(i,"Zipped Source Files")
@@ -230,7 +231,7 @@ def processPAGE(i, files, rscnames, sect, data, mh, pagemapproc):
         outname = os.path.join(files.outdir, 'mobi8-'+files.getInputFileBasename() + '.apnx')
     else:
         outname = os.path.join(files.outdir, 'mobi7-'+files.getInputFileBasename() + '.apnx')
-    with open(pathof(outname), 'wb') as f:
+    with unipath.open(pathof(outname), 'wb') as f:
         f.write(apnx_data)
     return rscnames, pagemapproc
 
@@ -239,7 +240,7 @@ def processCMET(i, files, rscnames, sect, data):
     # extract the build log
     print("File contains kindlegen build log, extracting as %s" % KINDLEGENLOG_FILENAME)
     srcname = os.path.join(files.outdir, KINDLEGENLOG_FILENAME)
-    with open(pathof(srcname), 'wb') as f:
+    with unipath.open(pathof(srcname), 'wb') as f:
         f.write(data[10:])
     rscnames.append(None)
     sect.setsectiondescription(i,"Kindlegen log")
@@ -293,7 +294,7 @@ def processFONT(i, files, rscnames, sect, data, obfuscate_data, beg, rsc_ptr):
             obfuscate_data.append(fontname + ext)
         fontname += ext
         outfnt = os.path.join(files.imgdir, fontname)
-        with open(pathof(outfnt), 'wb') as f:
+        with unipath.open(pathof(outfnt), 'wb') as f:
             f.write(font_data)
         rscnames.append(fontname)
         sect.setsectiondescription(i,"Font {0:s}".format(fontname))
@@ -315,7 +316,7 @@ def processCRES(i, files, rscnames, sect, data, beg, rsc_ptr, use_hd):
         if DUMP:
             fname = "unknown%05d.dat" % i
             outname= os.path.join(files.outdir, fname)
-            with open(pathof(outname), 'wb') as f:
+            with unipath.open(pathof(outname), 'wb') as f:
                 f.write(data)
             sect.setsectiondescription(i,"Mysterious CRES data, first four bytes %s extracting as %s" % (describe(data[0:4]), fname))
         rsc_ptr += 1
@@ -330,7 +331,7 @@ def processCRES(i, files, rscnames, sect, data, beg, rsc_ptr, use_hd):
         imgdest = files.hdimgdir
     print("Extracting HD image: {0:s} from section {1:d}".format(imgname,i))
     outimg = os.path.join(imgdest, imgname)
-    with open(pathof(outimg), 'wb') as f:
+    with unipath.open(pathof(outimg), 'wb') as f:
         f.write(data)
     rscnames.append(None)
     sect.setsectiondescription(i,"Optional HD Image {0:s}".format(imgname))
@@ -356,7 +357,7 @@ def processCONT(i, files, rscnames, sect, data):
             dump_contexth(cpage, contexth)
             fname = "CONT_Header%05d.dat" % i
             outname= os.path.join(files.outdir, fname)
-            with open(pathof(outname), 'wb') as f:
+            with unipath.open(pathof(outname), 'wb') as f:
                 f.write(data)
     return rscnames
 
@@ -380,7 +381,7 @@ def processRESC(i, files, rscnames, sect, data, k8resc):
         rescname = "RESC%05d.dat" % i
         print("Extracting Resource: ", rescname)
         outrsc = os.path.join(files.outdir, rescname)
-        with open(pathof(outrsc), 'wb') as f:
+        with unipath.open(pathof(outrsc), 'wb') as f:
             f.write(data)
     if True:  # try:
         # parse the spine and metadata from RESC
@@ -404,7 +405,7 @@ def processImage(i, files, rscnames, sect, data, beg, rsc_ptr, cover_offset):
         if DUMP:
             fname = "unknown%05d.dat" % i
             outname= os.path.join(files.outdir, fname)
-            with open(pathof(outname), 'wb') as f:
+            with unipath.open(pathof(outname), 'wb') as f:
                 f.write(data)
             sect.setsectiondescription(i,"Mysterious Section, first four bytes %s extracting as %s" % (describe(data[0:4]), fname))
         return rscnames, rsc_ptr
@@ -414,7 +415,7 @@ def processImage(i, files, rscnames, sect, data, beg, rsc_ptr, cover_offset):
         imgname = "cover%05d.%s" % (i, imgtype)
     print("Extracting image: {0:s} from section {1:d}".format(imgname,i))
     outimg = os.path.join(files.imgdir, imgname)
-    with open(pathof(outimg), 'wb') as f:
+    with unipath.open(pathof(outimg), 'wb') as f:
         f.write(data)
     rscnames.append(imgname)
     sect.setsectiondescription(i,"Image {0:s}".format(imgname))
@@ -429,7 +430,7 @@ def processPrintReplica(metadata, files, rscnames, mh):
     rawML = mh.getRawML()
     if DUMP or WRITE_RAW_DATA:
         outraw = os.path.join(files.outdir,files.getInputFileBasename() + '.rawpr')
-        with open(pathof(outraw),'wb') as f:
+        with unipath.open(pathof(outraw),'wb') as f:
             f.write(rawML)
 
     fileinfo = []
@@ -448,7 +449,7 @@ def processPrintReplica(metadata, files, rscnames, mh):
                     entryName = os.path.join(files.outdir, files.getInputFileBasename() + ('.%03d.pdf' % (i+1)))
                 else:
                     entryName = os.path.join(files.outdir, files.getInputFileBasename() + ('.%03d.%03d.data' % ((i+1),j)))
-                with open(pathof(entryName), 'wb') as f:
+                with unipath.open(pathof(entryName), 'wb') as f:
                     f.write(rawML[sectionOffset:(sectionOffset+sectionLength)])
     except Exception as e:
         print('Error processing Print Replica: ' + str(e))
@@ -470,7 +471,7 @@ def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfus
     rawML = mh.getRawML()
     if DUMP or WRITE_RAW_DATA:
         outraw = os.path.join(files.k8dir,files.getInputFileBasename() + '.rawml')
-        with open(pathof(outraw),'wb') as f:
+        with unipath.open(pathof(outraw),'wb') as f:
             f.write(rawML)
 
     # KF8 require other indexes which contain parsing information and the FDST info
@@ -511,7 +512,7 @@ def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfus
     if pagemapproc is not None:
         pagemapxml = pagemapproc.generateKF8PageMapXML(k8proc)
         outpm = os.path.join(files.k8oebps,'page-map.xml')
-        with open(pathof(outpm),'wb') as f:
+        with unipath.open(pathof(outpm),'wb') as f:
             f.write(pagemapxml.encode('utf-8'))
         if DUMP:
             print(pagemapproc.getNames())
@@ -570,7 +571,7 @@ def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfus
         [skelnum, dir, filename, beg, end, aidtext] = k8proc.getPartInfo(i)
         fileinfo.append([str(skelnum), dir, filename])
         fname = os.path.join(files.k8oebps,dir,filename)
-        with open(pathof(fname),'wb') as f:
+        with unipath.open(pathof(fname),'wb') as f:
             f.write(part)
     n = k8proc.getNumberOfFlows()
     for i in range(1, n):
@@ -579,7 +580,7 @@ def processMobi8(mh, metadata, sect, files, rscnames, pagemapproc, k8resc, obfus
         if pformat == b'file':
             fileinfo.append([None, pdir, filename])
             fname = os.path.join(files.k8oebps,pdir,filename)
-            with open(pathof(fname),'wb') as f:
+            with unipath.open(pathof(fname),'wb') as f:
                 f.write(flowpart)
 
     # create the opf
@@ -607,7 +608,7 @@ def processMobi7(mh, metadata, sect, files, rscnames):
     rawML = mh.getRawML()
     if DUMP or WRITE_RAW_DATA:
         outraw = os.path.join(files.mobi7dir,files.getInputFileBasename() + '.rawml')
-        with open(pathof(outraw),'wb') as f:
+        with unipath.open(pathof(outraw),'wb') as f:
             f.write(rawML)
 
     # process the toc ncx
@@ -637,7 +638,7 @@ def processMobi7(mh, metadata, sect, files, rscnames):
     fname = 'book.html'
     fileinfo.append([None,'', fname])
     outhtml = os.path.join(files.mobi7dir, fname)
-    with open(pathof(outhtml), 'wb') as f:
+    with unipath.open(pathof(outhtml), 'wb') as f:
         f.write(srctext)
 
     # extract guidetext from srctext
@@ -714,7 +715,7 @@ def processUnknownSections(mh, sect, files, K8Boundary):
                 description = "Unknown INDX section"
                 if DUMP:
                     outname= os.path.join(files.outdir, fname)
-                    with open(pathof(outname), 'wb') as f:
+                    with unipath.open(pathof(outname), 'wb') as f:
                         f.write(data)
                     print("Extracting %s: %s from section %d" % (description, fname, i))
                     description = description + ", extracting as %s" % fname
@@ -723,7 +724,7 @@ def processUnknownSections(mh, sect, files, K8Boundary):
                 description = "Mysterious Section, first four bytes %s" % describe(data[0:4])
                 if DUMP:
                     outname= os.path.join(files.outdir, fname)
-                    with open(pathof(outname), 'wb') as f:
+                    with unipath.open(pathof(outname), 'wb') as f:
                         f.write(data)
                     print("Extracting %s: %s from section %d" % (description, fname, i))
                     description = description + ", extracting as %s" % fname
@@ -757,7 +758,7 @@ def process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, k8only=Fa
 
         if DUMP:
             # write out raw mobi header data
-            with open(pathof(mhname), 'wb') as f:
+            with unipath.open(pathof(mhname), 'wb') as f:
                 f.write(mh.header)
 
         # process each mobi header
@@ -794,7 +795,7 @@ def process_all_mobi_headers(files, apnxfile, sect, mhlst, K8Boundary, k8only=Fa
                         fname += "_K8"
                     fname += '.dat'
                     outname= os.path.join(files.outdir, fname)
-                    with open(pathof(outname), 'wb') as f:
+                    with unipath.open(pathof(outname), 'wb') as f:
                         f.write(data)
                     print("Dumping section {0:d} type {1:s} to file {2:s} ".format(i,unicode_str(type),outname))
                 sect.setsectiondescription(i,"Type {0:s}".format(unicode_str(type)))
@@ -910,10 +911,12 @@ def unpackBook(infile, outdir, apnxfile=None, epubver='2', use_hd=False, dodump=
                 if mobisplit.combo:
                     outmobi7 = os.path.join(files.outdir, 'mobi7-'+files.getInputFileBasename() + '.mobi')
                     outmobi8 = os.path.join(files.outdir, 'mobi8-'+files.getInputFileBasename() + '.azw3')
-                    with open(pathof(outmobi7), 'wb') as f:
+                    with unipath.open(pathof(outmobi7), 'wb') as f:
                         f.write(mobisplit.getResult7())
-                    with open(pathof(outmobi8), 'wb') as f:
+                    with unipath.open(pathof(outmobi8), 'wb') as f:
                         f.write(mobisplit.getResult8())
+                # both halves are full copies of the book
+                del mobisplit
         else:
             print("Unpacking a Mobipocket {0:d} book...".format(mh.version))
 
@@ -924,6 +927,7 @@ def unpackBook(infile, outdir, apnxfile=None, epubver='2', use_hd=False, dodump=
 
     if DUMP:
         sect.dumpsectionsinfo()
+    sect.close()
     return
 
 
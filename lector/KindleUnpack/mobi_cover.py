@@ -6,6 +6,7 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 
 from .compatibility_utils import unicode_str
 
+from . import unipath
 from .unipath import pathof
 import os
 import imghdr
@@ -34,15 +35,16 @@ MAX_HEIGHT = 4096
 
 
 def get_image_type(imgname, imgdata=None):
-    imgtype = unicode_str(imghdr.what(pathof(imgname), imgdata))
+    # Images may only exist in memory, where imghdr can't open them
+    if imgdata is None:
+        with unipath.open(pathof(imgname), 'rb') as f:
+            imgdata = f.read()
+    imgtype = unicode_str(imghdr.what(None, imgdata))
 
     # imghdr only checks for JFIF or Exif JPEG files. Apparently, there are some
     # with only the magic JPEG bytes out there...
     # ImageMagick handles those, so, do it too.
     if imgtype is None:
-        if imgdata is None:
-            with open(pathof(imgname), 'rb') as f:
-                imgdata = f.read()
         if imgdata[0:2] == b'\xFF\xD8':
             # Get last non-null bytes
             last = len(imgdata)
@@ -61,7 +63,7 @@ def get_image_size(imgname, imgdata=None):
     Determine the image type of fhandle and return its size.
     from draco'''
     if imgdata is None:
-        fhandle = open(pathof(imgname), 'rb')
+        fhandle = unipath.open(pathof(imgname), 'rb')
         head = fhandle.read(24)
     else:
         head = imgdata[0:24]
@@ -223,10 +225,10 @@ class CoverProcessor(object):
         data = self.buildXHTML()
 
         outfile = os.path.join(files.k8text, cover_page)
-        if os.path.exists(pathof(outfile)):
+        if unipath.exists(pathof(outfile)):
             print('Warning: {:s} already exists.'.format(cover_page))
-            os.remove(pathof(outfile))
-        with open(pathof(outfile), 'wb') as f:
+            unipath.remove(pathof(outfile))
+        with unipath.open(pathof(outfile), 'wb') as f:
             f.write(data.encode('utf-8'))
         return
 
@@ -17,8 +17,10 @@ from .compatibility_utils import PY2, unicode_str, hexlify, bord
 if PY2:
     range = xrange
 
+import sys
 import struct
 import uuid
+import multiprocessing
 
 # import the mobiunpack support libraries
 from .mobi_utils import getLanguage
@@ -28,6 +30,43 @@ class unpackException(Exception):
     pass
 
 
+# text records are decompressed in parallel only when there are enough
+# of them to make up for starting the worker processes
+PARALLEL_RECORDS = 256
+
+_record_unpack = None
+
+def _initRecordWorker(unpack):
+    global _record_unpack
+    _record_unpack = unpack
+
+def _unpackRecord(data):
+    return _record_unpack(data)
+
+def unpackRecords(unpack, records):
+    # records do not depend on each other so they are spread across
+    # a process pool, the decoders are pure python and threads would
+    # only take turns holding the GIL
+    # daemonic processes (such as pool workers) cannot have children
+    # and the pool is skipped when windows' process spawning is involved
+    workers = multiprocessing.cpu_count()
+    if (len(records) < PARALLEL_RECORDS or workers < 2 or
+            sys.platform.startswith('win') or
+            multiprocessing.current_process().daemon):
+        return [unpack(data) for data in records]
+
+    chunksize = len(records) // (workers * 4) + 1
+    pool = multiprocessing.Pool(workers, _initRecordWorker, (unpack,))
+    try:
+        # imap returns results in the order of the records
+        # memoryviews cannot be pickled, records are copied as they are sent
+        return list(pool.imap(
+            _unpackRecord, (bytes(data) for data in records), chunksize))
+    finally:
+        pool.close()
+        pool.join()
+
+
 def sortedHeaderKeys(mheader):
     hdrkeys = sorted(list(mheader.keys()), key=lambda akey: mheader[akey][0])
     return hdrkeys
@@ -823,7 +862,7 @@ class MobiHeader:
                 num = getSizeOfTrailingDataEntry(data)
                 data = data[:-num]
             if multibyte:
-                num = (ord(data[-1:]) & 3) + 1
+                num = (bord(data[-1]) & 3) + 1
                 data = data[:-num]
             return data
         multibyte = 0
@@ -840,17 +879,20 @@ class MobiHeader:
                     flags = flags >> 1
         # get raw mobi markup languge
         print("Unpacking raw markup language")
-        dataList = []
+        records = []
         # offset = 0
         for i in range(1, self.records+1):
-            data = trimTrailingDataEntries(self.sect.loadSection(self.start + i))
-            dataList.append(self.unpack(data))
+            records.append(trimTrailingDataEntries(self.sect.loadSectionView(self.start + i)))
             if self.isK8():
                 self.sect.setsectiondescription(self.start + i,"KF8 Text Section {0:d}".format(i))
             elif self.version == 0:
                 self.sect.setsectiondescription(self.start + i,"PalmDOC Text Section {0:d}".format(i))
             else:
                 self.sect.setsectiondescription(self.start + i,"Mobipocket Text Section {0:d}".format(i))
+        if self.compression == 1:
+            dataList = records
+        else:
+            dataList = unpackRecords(self.unpack, records)
         rawML = b''.join(dataList)
         self.rawSize = len(rawML)
         return rawML
@@ -21,6 +21,7 @@ import re
 
 from .mobi_index import MobiIndex
 from .mobi_utils import fromBase32
+from . import unipath
 from .unipath import pathof
 
 _guide_types = [b'cover',b'title-page',b'toc',b'index',b'glossary',b'acknowledgements',
@@ -216,7 +217,7 @@ class K8Processor:
         assembled_text = b''.join(self.parts)
         if self.DEBUG:
             outassembled = os.path.join(self.files.k8dir, 'assembled_text.dat')
-            with open(pathof(outassembled),'wb') as f:
+            with unipath.open(pathof(outassembled),'wb') as f:
                 f.write(assembled_text)
 
         # The primary css style sheet is typically stored next followed by any
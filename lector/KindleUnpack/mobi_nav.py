@@ -6,6 +6,7 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 
 from .compatibility_utils import unicode_str
 import os
+from . import unipath
 from .unipath import pathof
 
 import re
@@ -182,5 +183,5 @@ class NAVProcessor(object):
         # print("Write Navigation Document.")
         xhtml = self.buildNAV(ncx_data, guidetext, metadata.get('Title')[0], metadata.get('Language')[0])
         fname = os.path.join(self.files.k8text, self.navname)
-        with open(pathof(fname), 'wb') as f:
+        with unipath.open(pathof(fname), 'wb') as f:
             f.write(xhtml.encode('utf-8'))
@@ -5,6 +5,7 @@
 from __future__ import unicode_literals, division, absolute_import, print_function
 
 import os
+from . import unipath
 from .unipath import pathof
 
 
@@ -181,7 +182,7 @@ class ncxExtract:
         # write the ncx file
         # ncxname = os.path.join(self.files.mobi7dir, self.files.getInputFileBasename() + '.ncx')
         ncxname = os.path.join(self.files.mobi7dir, 'toc.ncx')
-        with open(pathof(ncxname), 'wb') as f:
+        with unipath.open(pathof(ncxname), 'wb') as f:
             f.write(xml.encode('utf-8'))
 
     def buildK8NCX(self, indx_data, title, ident, lang):
@@ -268,5 +269,5 @@ class ncxExtract:
         xml = self.buildK8NCX(ncx_data, metadata['Title'][0], metadata['UniqueID'][0], metadata.get('Language')[0])
         bname = 'toc.ncx'
         ncxname = os.path.join(self.files.k8oebps,bname)
-        with open(pathof(ncxname), 'wb') as f:
+        with unipath.open(pathof(ncxname), 'wb') as f:
             f.write(xml.encode('utf-8'))
@@ -7,6 +7,7 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 from .compatibility_utils import unicode_str, unescapeit
 from .compatibility_utils import lzip
 
+from . import unipath
 from .unipath import pathof
 
 from xml.sax.saxutils import escape as xmlescape
@@ -540,13 +541,13 @@ class OPFProcessor(object):
         if self.isK8:
             data = self.buildEPUBOPF(has_obfuscated_fonts)
             outopf = os.path.join(self.files.k8oebps, EPUB_OPF)
-            with open(pathof(outopf), 'wb') as f:
+            with unipath.open(pathof(outopf), 'wb') as f:
                 f.write(data.encode('utf-8'))
             return self.BookId
         else:
             data = self.buildMobi7OPF()
             outopf = os.path.join(self.files.mobi7dir, 'content.opf')
-            with open(pathof(outopf), 'wb') as f:
+            with unipath.open(pathof(outopf), 'wb') as f:
                 f.write(data.encode('utf-8'))
             return 0
 
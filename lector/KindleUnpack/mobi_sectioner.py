@@ -7,6 +7,7 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 from .compatibility_utils import PY2, hexlify, bstr, bord, bchar
 
 import datetime
+import mmap
 
 if PY2:
     range = xrange
@@ -42,12 +43,22 @@ def datetimefrompalmtime(palmtime):
     return pythondatetime
 
 
+def mapfile(f):
+    # maps a file opened for reading into memory instead of reading it in
+    # slicing the map returns bytes, so it can stand in for the file's data
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, mmap.error):
+        # empty files cannot be mapped
+        return f.read()
+
+
 class Sectionizer:
 
     def __init__(self, filename):
         self.data = b''
         with open(pathof(filename), 'rb') as f:
-            self.data = f.read()
+            self.data = mapfile(f)
         self.palmheader = self.data[:78]
         self.palmname = self.data[:32]
         self.ident = self.palmheader[0x3C:0x3C+8]
@@ -118,3 +129,18 @@ class Sectionizer:
     def loadSection(self, section):
         before, after = self.sectionoffsets[section:section+2]
         return self.data[before:after]
+
+    def loadSectionView(self, section):
+        # the section without copying it out of the file
+        # only valid until the sectionizer is closed
+        before, after = self.sectionoffsets[section:section+2]
+        return memoryview(self.data)[before:after]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                # views are still around, the map goes when they do
+                pass
+        self.data = b''
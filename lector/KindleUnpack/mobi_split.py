@@ -4,11 +4,13 @@
 
 from __future__ import unicode_literals, division, absolute_import, print_function
 
+import mmap
 import struct
 # note:  struct pack, unpack, unpack_from all require bytestring format
 # data all the way up to at least python 2.7.5, python 3 okay with bytestring
 
 from .unipath import pathof
+from .mobi_sectioner import mapfile
 
 
 # important  pdb header offsets
@@ -295,7 +297,14 @@ class mobi_split:
     def __init__(self, infile):
         datain = b''
         with open(pathof(infile), 'rb') as f:
-            datain = f.read()
+            datain = mapfile(f)
+        try:
+            self.split(datain)
+        finally:
+            if isinstance(datain, mmap.mmap):
+                datain.close()
+
+    def split(self, datain):
         datain_rec0 = readsection(datain,0)
         ver = getint(datain_rec0,mobi_version)
         self.combo = (ver!=8)
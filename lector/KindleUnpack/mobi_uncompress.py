@@ -4,7 +4,7 @@
 
 from __future__ import unicode_literals, division, absolute_import, print_function
 
-from .compatibility_utils import PY2, bchr, lmap, bstr
+from .compatibility_utils import PY2, lmap, bstr
 
 if PY2:
     range = xrange
@@ -25,35 +25,40 @@ class UncompressedReader:
 class PalmdocReader:
 
     def unpack(self, i):
-        o, p = b'', 0
-        while p < len(i):
-            # for python 3 must use slice since i[p] returns int while slice returns character
-            c = ord(i[p:p+1])
+        # indexing a bytearray gives ints on both python 2 and 3
+        i = bytearray(i)
+        o = bytearray()
+        p, end = 0, len(i)
+        while p < end:
+            c = i[p]
             p += 1
             if (c >= 1 and c <= 8):
                 o += i[p:p+c]
                 p += c
             elif (c < 128):
-                o += bchr(c)
+                o.append(c)
             elif (c >= 192):
-                o += b' ' + bchr(c ^ 128)
-            else:
-                if p < len(i):
-                    c = (c << 8) | ord(i[p:p+1])
-                    p += 1
-                    m = (c >> 3) & 0x07ff
-                    n = (c & 7) + 3
-                    if (m > n):
-                        o += o[-m:n-m]
-                    else:
-                        for _ in range(n):
-                            # because of completely ass-backwards decision by python mainters for python 3
-                            # we must use slice for bytes as i[p] returns int while slice returns character
-                            if m == 1:
-                                o += o[-m:]
-                            else:
-                                o += o[-m:-m+1]
-        return o
+                o.append(0x20)
+                o.append(c ^ 128)
+            elif p < end:
+                c = (c << 8) | i[p]
+                p += 1
+                m = (c >> 3) & 0x07ff
+                n = (c & 7) + 3
+                if (m > n):
+                    # source and destination do not overlap so copy in one go
+                    o += o[-m:n-m]
+                elif 0 < m <= len(o):
+                    # overlapping copy repeats the last m bytes
+                    o += (o[-m:] * (n // m + 1))[:n]
+                else:
+                    # invalid distance, copy byte by byte as before
+                    for _ in range(n):
+                        if m == 1:
+                            o += o[-m:]
+                        else:
+                            o += o[-m:-m+1]
+        return bytes(o)
 
 class HuffcdicReader:
     q = struct.Struct(b'>Q').unpack_from
@@ -79,6 +84,18 @@ class HuffcdicReader:
         for codelen, maxcode in enumerate((0,) + dict2[1::2]):
             self.maxcode += (((maxcode + 1) << (32 - codelen)) - 1, )
 
+        # resolve every code of up to 12 bits from its top 12 bits in one
+        # lookup, only longer codes need to search for their length
+        self.lookup = []
+        for prefix in range(4096):
+            code = prefix << 20
+            codelen, term, maxcode = self.dict1[prefix >> 4]
+            if not term:
+                while codelen <= 12 and code < self.mincode[codelen]:
+                    codelen += 1
+                maxcode = self.maxcode[codelen] if codelen <= 12 else None
+            self.lookup.append((codelen, maxcode))
+
         self.dictionary = []
 
     def loadCdic(self, cdic):
@@ -93,39 +110,63 @@ class HuffcdicReader:
             return (slice, blen&0x8000)
         self.dictionary += lmap(getslice, struct.unpack_from(bstr('>%dH' % n), cdic, 16))
 
-    def unpack(self, data):
+    def decode(self, data):
+        # returns the dictionary indices of the huffman codes in data
         q = HuffcdicReader.q
+        lookup, mincodes, maxcodes = self.lookup, self.mincode, self.maxcode
 
         bitsleft = len(data) * 8
-        data += b"\x00\x00\x00\x00\x00\x00\x00\x00"
+        data = bytes(data) + b"\x00\x00\x00\x00\x00\x00\x00\x00"
         pos = 0
         x, = q(data, pos)
         n = 32
 
-        s = b''
+        codes = []
+        append = codes.append
         while True:
             if n <= 0:
                 pos += 4
                 x, = q(data, pos)
                 n += 32
-            code = (x >> n) & ((1 << 32) - 1)
+            code = (x >> n) & 0xffffffff
 
-            codelen, term, maxcode = self.dict1[code >> 24]
-            if not term:
-                while code < self.mincode[codelen]:
+            codelen, maxcode = lookup[code >> 20]
+            if maxcode is None:
+                while code < mincodes[codelen]:
                     codelen += 1
-                maxcode = self.maxcode[codelen]
+                maxcode = maxcodes[codelen]
 
             n -= codelen
             bitsleft -= codelen
             if bitsleft < 0:
                 break
 
-            r = (maxcode - code) >> (32 - codelen)
-            slice, flag = self.dictionary[r]
-            if not flag:
-                self.dictionary[r] = None
-                slice = self.unpack(slice)
-                self.dictionary[r] = (slice, 1)
-            s += slice
-        return s
+            append((maxcode - code) >> (32 - codelen))
+        return codes
+
+    def unpack(self, data):
+        # dictionary entries may themselves be compressed and refer to other
+        # entries, these are expanded with an explicit stack instead of
+        # recursion and the expanded text replaces the entry for next time
+        dictionary = self.dictionary
+        stack = [(None, iter(self.decode(data)), bytearray())]
+        while True:
+            index, codes, output = stack[-1]
+            for r in codes:
+                entry = dictionary[r]
+                if entry is None:
+                    raise unpackException('recursive huffcdic dictionary entry')
+                slice, flag = entry
+                if flag:
+                    output += slice
+                else:
+                    dictionary[r] = None
+                    stack.append((r, iter(self.decode(slice)), bytearray()))
+                    break
+            else:
+                stack.pop()
+                slice = bytes(output)
+                if index is None:
+                    return slice
+                dictionary[index] = (slice, 1)
+                stack[-1][2].extend(slice)
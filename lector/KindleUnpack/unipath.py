@@ -30,6 +30,8 @@ from .compatibility_utils import PY2, text_type, binary_type
 
 import sys
 import os
+import io
+import zipfile
 
 # utility routines to convert all paths to be full unicode
 
@@ -53,19 +55,120 @@ def pathof(s, enc=fsencoding):
             pass
     return s
 
+# In-memory output
+# Nothing under a directory mounted with mount_memory() is written to disk.
+# Files and directories created there are kept in a MemoryFS instead,
+# and every routine in here (and open) finds them transparently.
+
+class MemoryFile(io.BytesIO):
+
+    def __init__(self, memfs, name, data=b''):
+        io.BytesIO.__init__(self, data)
+        self.memfs = memfs
+        self.name = name
+
+    def close(self):
+        if not self.closed:
+            self.memfs.files[self.name] = self.getvalue()
+        io.BytesIO.close(self)
+
+class MemoryFS:
+
+    def __init__(self, root):
+        self.root = os.path.normpath(pathof(root))
+        self.files = {}  # relative path using '/': data
+        self.dirs = set([''])
+
+    def relative(self, s):
+        s = os.path.normpath(pathof(s))
+        if s == self.root:
+            return ''
+        if s.startswith(self.root + os.sep):
+            return s[len(self.root) + 1:].replace(os.sep, '/')
+        return None
+
+    def listdir(self, rel):
+        prefix = rel + '/' if rel else ''
+        rv = set()
+        for name in list(self.files) + list(self.dirs):
+            if name and name.startswith(prefix):
+                rv.add(name[len(prefix):].split('/')[0])
+        return sorted(rv)
+
+    def makezip(self, rel):
+        # zip up a directory, returning the archive as bytes
+        prefix = rel + '/' if rel else ''
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as myzip:
+            for name in sorted(self.files):
+                if name.startswith(prefix):
+                    myzip.writestr(name[len(prefix):], self.files[name])
+        return data.getvalue()
+
+_memory_mounts = []
+
+def mount_memory(s):
+    memfs = MemoryFS(s)
+    _memory_mounts.append(memfs)
+    return memfs
+
+def unmount_memory(memfs):
+    _memory_mounts.remove(memfs)
+
+def _find_memory(s):
+    for memfs in _memory_mounts:
+        rel = memfs.relative(s)
+        if rel is not None:
+            return memfs, rel
+    return None, None
+
+def open(s, mode='r', *args, **kwargs):
+    memfs, rel = _find_memory(s)
+    if memfs is None:
+        return io.open(pathof(s), mode, *args, **kwargs)
+    if 'r' in mode:
+        if rel not in memfs.files:
+            raise IOError('No such file: ' + pathof(s))
+        return io.BytesIO(memfs.files[rel])
+    data = memfs.files.get(rel, b'') if 'a' in mode else b''
+    memfile = MemoryFile(memfs, rel, data)
+    memfile.seek(0, io.SEEK_END)
+    return memfile
+
+def remove(s):
+    memfs, rel = _find_memory(s)
+    if memfs is None:
+        return os.remove(pathof(s))
+    del memfs.files[rel]
+
 def exists(s):
-    return os.path.exists(pathof(s))
+    memfs, rel = _find_memory(s)
+    if memfs is None:
+        return os.path.exists(pathof(s))
+    return rel in memfs.files or rel in memfs.dirs
 
 def isfile(s):
-    return os.path.isfile(pathof(s))
+    memfs, rel = _find_memory(s)
+    if memfs is None:
+        return os.path.isfile(pathof(s))
+    return rel in memfs.files
 
 def isdir(s):
-    return os.path.isdir(pathof(s))
+    memfs, rel = _find_memory(s)
+    if memfs is None:
+        return os.path.isdir(pathof(s))
+    return rel in memfs.dirs
 
 def mkdir(s):
-    return os.mkdir(pathof(s))
+    memfs, rel = _find_memory(s)
+    if memfs is None:
+        return os.mkdir(pathof(s))
+    memfs.dirs.add(rel)
 
 def listdir(s):
+    memfs, rel = _find_memory(s)
+    if memfs is not None:
+        return memfs.listdir(rel)
     rv = []
     for file in os.listdir(pathof(s)):
         rv.append(pathof(file))
@@ -88,7 +88,8 @@ class fileNames:
             localfilePath = os.path.join(localname, afilename)
             realfilePath = os.path.join(currentdir,file)
             if unipath.isfile(realfilePath):
-                myzip.write(pathof(realfilePath), pathof(localfilePath), zipfile.ZIP_DEFLATED)
+                with unipath.open(pathof(realfilePath), 'rb') as f:
+                    myzip.writestr(pathof(localfilePath), f.read(), zipfile.ZIP_DEFLATED)
             elif unipath.isdir(realfilePath):
                 self.zipUpDir(myzip, tdir, localfilePath)
 
@@ -117,14 +118,15 @@ class fileNames:
                 else:
                     fileout = os.path.join(self.k8images,name)
                 data = b''
-                with open(pathof(filein),'rb') as f:
+                with unipath.open(pathof(filein),'rb') as f:
                     data = f.read()
                 if obfuscate_data:
                     if name in obfuscate_data:
                         data = mangle_fonts(key, data)
-                open(pathof(fileout),'wb').write(data)
+                with unipath.open(pathof(fileout),'wb') as f:
+                    f.write(data)
                 if name.endswith(".ttf") or name.endswith(".otf"):
-                    os.remove(pathof(filein))
+                    unipath.remove(pathof(filein))
 
         # opf file name hard coded to "content.opf"
         container = '<?xml version="1.0" encoding="UTF-8"?>\n'
@@ -133,7 +135,7 @@ class fileNames:
         container += '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
         container += '    </rootfiles>\n</container>\n'
         fileout = os.path.join(self.k8metainf,'container.xml')
-        with open(pathof(fileout),'wb') as f:
+        with unipath.open(pathof(fileout),'wb') as f:
             f.write(container.encode('utf-8'))
 
         if obfuscate_data:
@@ -148,16 +150,17 @@ xmlns:enc="http://www.w3.org/2001/04/xmlenc#" xmlns:deenc="http://ns.adobe.com/d
                 encryption += '  </enc:EncryptedData>\n'
             encryption += '</encryption>\n'
             fileout = os.path.join(self.k8metainf,'encryption.xml')
-            with open(pathof(fileout),'wb') as f:
+            with unipath.open(pathof(fileout),'wb') as f:
                 f.write(encryption.encode('utf-8'))
 
         # ready to build epub
-        self.outzip = zipfile.ZipFile(pathof(bname), 'w')
+        self.outfile = unipath.open(pathof(bname), 'wb')
+        self.outzip = zipfile.ZipFile(self.outfile, 'w')
 
         # add the mimetype file uncompressed
         mimetype = b'application/epub+zip'
         fileout = os.path.join(self.k8dir,'mimetype')
-        with open(pathof(fileout),'wb') as f:
+        with unipath.open(pathof(fileout),'wb') as f:
             f.write(mimetype)
         nzinfo = ZipInfo('mimetype', compress_type=zipfile.ZIP_STORED)
         nzinfo.external_attr = 0o600 << 16 # make this a normal file
@@ -165,3 +168,4 @@ xmlns:enc="http://www.w3.org/2001/04/xmlenc#" xmlns:deenc="http://ns.adobe.com/d
         self.zipUpDir(self.outzip,self.k8dir,'META-INF')
         self.zipUpDir(self.outzip,self.k8dir,'OEBPS')
         self.outzip.close()
+        self.outfile.close()
@@ -19,7 +19,6 @@
 import os
 import gc
 import sys
-import hashlib
 import pathlib
 
 # This allows for the program to be launched from the
@@ -45,10 +44,12 @@ from lector.widgets import Tab, DragDropListView, DragDropTableView
 from lector.delegates import LibraryDelegate
 from lector.threaded import BackGroundTabUpdate, BackGroundBookAddition, BackGroundBookDeletion
 from lector.library import Library
+from lector.watcher import LibraryWatcher
 from lector.guifunctions import QImageFactory, CoverLoadingAndCulling, ViewProfileModification
 from lector.settings import Settings
 from lector.settingsdialog import SettingsUI
 from lector.metadatadialog import MetadataUI
+from lector.duplicatesdialog import DuplicatesUI
 from lector.definitionsdialog import DefinitionsUI
 from lector.resources import mainwindow, resources
 
@@ -85,6 +86,7 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.comic_profile = {}
         self.database_path = None
         self.active_library_filters = []
+        self.show_duplicates_only = False
         self.active_docks = []
 
         # Initialize application
@@ -148,6 +150,9 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         # Init the Library
         self.lib_ref = Library(self)
 
+        # Keeps the library in sync with its folders
+        self.library_watcher = LibraryWatcher(self)
+
         # Initialize Cover loading functions
         # Must be after the Library init
         self.cover_functions = CoverLoadingAndCulling(self)
@@ -286,7 +291,7 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.listView.setMouseTracking(True)
         self.listView.verticalScrollBar().setSingleStep(9)
         self.listView.doubleClicked.connect(self.library_doubleclick)
-        self.listView.setItemDelegate(LibraryDelegate(self.temp_dir.path(), self))
+        self.listView.setItemDelegate(LibraryDelegate(self))
         self.listView.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.listView.customContextMenuRequested.connect(self.generate_library_context_menu)
         self.listView.verticalScrollBar().valueChanged.connect(self.start_culling_timer)
@@ -346,12 +351,19 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.ksDeletePressed.setContext(QtCore.Qt.ApplicationShortcut)
         self.ksDeletePressed.activated.connect(self.delete_pressed)
 
+        # Check for missing files whenever the application regains focus
+        QtWidgets.qApp.applicationStateChanged.connect(
+            self.lib_ref.refresh_file_check)
+
         self.listView.setFocus()
         self.open_books_at_startup()
 
         # Scan the library @ startup
+        # Otherwise, watch whatever the last scan found
         if self.settings['scan_library']:
             self.settingsDialog.start_library_scan()
+        else:
+            self.library_watcher.watch_directories()
 
     def open_books_at_startup(self):
         # Last open books and command line books aren't being opened together
@@ -412,17 +424,18 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             file_md5 = filename[1]
             if not file_md5:
                 try:
-                    with open(filename[0], 'rb') as current_book:
-                        first_bytes = current_book.read(1024 * 32)  # First 32KB of the file
-                        file_md5 = hashlib.md5(first_bytes).hexdigest()
+                    file_md5 = sorter.identify_file(filename[0])[0]
                 except FileNotFoundError:
                     return
 
             # Remove any already open files
             # Set focus to last file in case only one is open
+            # Books are identified by content hash since they
+            # were versioned, so paths are compared as well
             for i in range(1, self.tabWidget.count()):
                 tab_metadata = self.tabWidget.widget(i).metadata
-                if tab_metadata['hash'] == file_md5:
+                if (tab_metadata['hash'] == file_md5
+                        or tab_metadata['path'] == filename[0]):
                     file_paths.remove(filename[0])
                     if not file_paths:
                         self.tabWidget.setCurrentIndex(i)
@@ -515,7 +528,8 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         # Get a list of QItemSelection objects
         # What we're interested in is the indexes()[0] in each of them
         # That gives a list of indexes from the view model
-        selected_indexes = self.get_selection()
+        if not selected_indexes:
+            selected_indexes = self.get_selection()
         if not selected_indexes:
             return
 
@@ -524,16 +538,12 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             if box_button.text() != '&Yes':
                 return
 
-            # Persistent model indexes are required beause deletion mutates the model
-            # Generate and delete by persistent index
+            # Rows are removed from the bottom up, so the
+            # indexes remain valid while deletion mutates the model
             delete_hashes = [
                 self.lib_ref.libraryModel.data(
                     i, QtCore.Qt.UserRole + 6) for i in selected_indexes]
-            persistent_indexes = [
-                QtCore.QPersistentModelIndex(i) for i in selected_indexes]
-
-            for i in persistent_indexes:
-                self.lib_ref.libraryModel.removeRow(i.row())
+            self.lib_ref.remove_rows([i.row() for i in selected_indexes])
 
             # Update the database in the background
             self.thread = BackGroundBookDeletion(
@@ -544,7 +554,10 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         # Generate a message box to confirm deletion
         confirm_deletion = QtWidgets.QMessageBox()
         deletion_prompt = self._translate(
-            'Main_UI', f'Delete book(s)?')
+            'Main_UI', 'Delete book(s)?')
+        if len(selected_indexes) > 1:
+            deletion_prompt = self._translate(
+                'Main_UI', 'Delete {0} books?').format(len(selected_indexes))
         confirm_deletion.setText(deletion_prompt)
         confirm_deletion.setIcon(QtWidgets.QMessageBox.Question)
         confirm_deletion.setWindowTitle(self._translate('Main_UI', 'Confirm deletion'))
@@ -617,6 +630,8 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
 
         # If library
         if self.tabWidget.currentIndex() == 0:
+            # Progress and last read times may have changed while reading
+            self.lib_ref.generate_sort_ranks()
             self.resizeEvent()
             self.start_culling_timer()
 
@@ -950,18 +965,41 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
 
         self.libraryFilterMenu.addActions(filter_actions)
         self.libraryFilterMenu.insertSeparator(filter_all)
+
+        # Duplicates are listed above the directories
+        self.duplicatesFilterAction = QtWidgets.QAction(
+            self._translate('Main_UI', 'Duplicates'), self.libraryFilterMenu)
+        self.duplicatesFilterAction.setCheckable(True)
+        self.duplicatesFilterAction.setChecked(self.show_duplicates_only)
+        self.duplicatesFilterAction.triggered.connect(self.set_duplicates_filter)
+
+        self.deleteDuplicatesAction = QtWidgets.QAction(
+            self.QImageFactory.get_image('trash-empty'),
+            self._translate('Main_UI', 'Delete Duplicates'),
+            self.libraryFilterMenu)
+        self.deleteDuplicatesAction.triggered.connect(self.delete_duplicates)
+
+        first_filter = filter_actions[0]
+        self.libraryFilterMenu.insertActions(
+            first_filter, [self.duplicatesFilterAction, self.deleteDuplicatesAction])
+        self.libraryFilterMenu.insertSeparator(first_filter)
+
         self.libraryToolBar.libraryFilterButton.setMenu(self.libraryFilterMenu)
 
     def set_library_filter(self, event=None):
         self.active_library_filters = []
         something_was_unchecked = False
 
+        # Directory filters are everything between the
+        # duplicates section and the separator before All
+        directory_filters = self.libraryFilterMenu.actions()[3:-2]
+
         if self.sender():  # Program startup sends a None here
             if self.sender().text() == 'All':
-                for i in self.libraryFilterMenu.actions():
+                for i in directory_filters + self.libraryFilterMenu.actions()[-1:]:
                     i.setChecked(self.sender().isChecked())
 
-        for i in self.libraryFilterMenu.actions()[:-2]:
+        for i in directory_filters:
             if i.isChecked():
                 self.active_library_filters.append(i.text())
             else:
@@ -974,6 +1012,26 @@ class MainUI(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
 
         self.lib_ref.update_proxymodels()
 
+    def set_duplicates_filter(self, event=None):
+        self.show_duplicates_only = self.duplicatesFilterAction.isChecked()
+        self.lib_ref.update_proxymodels()
+
+    def delete_duplicates(self):
+        surplus_groups = self.lib_ref.surplus_duplicates()
+        if not surplus_groups:
+            self.statusMessage.setText(
+                self._translate('Main_UI', 'No duplicates found'))
+            return
+
+        # The copies to be kept are suggested, and the user decides
+        duplicatesDialog = DuplicatesUI(self, surplus_groups)
+        if duplicatesDialog.exec_() != QtWidgets.QDialog.Accepted:
+            return
+
+        deletable_indexes = duplicatesDialog.deletable_indexes()
+        if deletable_indexes:
+            self.delete_books(deletable_indexes)
+
     def toggle_distraction_free(self):
         self.settings['show_bars'] = not self.settings['show_bars']
 
@@ -18,6 +18,7 @@ import os
 import zipfile
 import logging
 import webbrowser
+import collections
 
 try:
     import fitz
@@ -475,6 +476,7 @@ class PliantQTextBrowser(QtWidgets.QTextBrowser):
         # This is timed so as not to drive the processor nuts
         self.resizeTimer = QtCore.QTimer()
         self.resizeTimer.setSingleShot(True)
+        self.resizeTimer.timeout.connect(self.rescale_images)
         self.resizeTimer.timeout.connect(self.create_pages)
 
         self.annotation_mode = False
@@ -500,6 +502,127 @@ class PliantQTextBrowser(QtWidgets.QTextBrowser):
         self.page_cursors = []
         self.page_number = 0
 
+        # Images are decoded no wider than the text they're in
+        # Everything is keyed to that width and redone when it changes
+        self.padding = 0
+        self.image_width = None
+        self.image_cache = collections.OrderedDict()  # (File, width): QImage
+        self.image_cache_bytes = 0
+        self.image_cache_limit = 64 * 1024 * 1024
+        self.document_images = {}  # URL in the current document: File
+
+    def clear(self):
+        self.document_images.clear()
+        QtWidgets.QTextBrowser.clear(self)
+
+    def loadResource(self, resource_type, resource_url):
+        # Books that are read out of their archive also keep
+        # their resources there. Everything else is on disk.
+        book_content = self.parent.metadata['content']
+        is_archived = hasattr(book_content, 'read_resource')
+
+        if resource_type != QtGui.QTextDocument.ImageResource:
+            # Stylesheets are ignored for the sake of simplicity
+            if is_archived:
+                return QtCore.QVariant()
+            return QtWidgets.QTextBrowser.loadResource(
+                self, resource_type, resource_url)
+
+        if is_archived:
+            resource_file = book_content.find_resource(
+                self.parent.metadata['position']['current_chapter'] - 1,
+                resource_url.toString())
+        else:
+            resource_file = resource_url.toLocalFile() or resource_url.toString()
+
+        if not resource_file:
+            return QtCore.QVariant()
+
+        self.document_images[resource_url.toString()] = resource_file
+        return self.get_image(resource_file)
+
+    def get_text_width(self):
+        # Padding is applied to every block in format_view
+        text_width = (
+            self.viewport().width() -
+            2 * (self.padding + self.document().documentMargin()))
+        return max(int(text_width), 1)
+
+    def get_image(self, resource_file):
+        if self.image_width is None:
+            self.image_width = self.get_text_width()
+
+        cache_key = (resource_file, self.image_width)
+        try:
+            self.image_cache.move_to_end(cache_key)
+            return self.image_cache[cache_key]
+        except KeyError:
+            pass
+
+        book_content = self.parent.metadata['content']
+        if hasattr(book_content, 'read_resource'):
+            try:
+                image_data = book_content.read_resource(resource_file)
+            except (KeyError, zipfile.BadZipFile):
+                logger.error(f'Error reading {resource_file}')
+                return QtCore.QVariant()
+
+            image_buffer = QtCore.QBuffer()
+            image_buffer.setData(image_data)
+            image_reader = QtGui.QImageReader(image_buffer)
+        else:
+            image_reader = QtGui.QImageReader(resource_file)
+
+        # Images are only ever scaled down. Scaling happens while
+        # decoding, so the full size image is never in memory.
+        # Scaled images are drawn at the text width with
+        # as much detail as the screen can show.
+        image_size = image_reader.size()
+        scaled_width = None
+        if image_size.isValid() and image_size.width() > self.image_width:
+            scaled_width = min(
+                image_size.width(),
+                int(self.image_width * self.devicePixelRatioF()))
+            image_reader.setScaledSize(image_size.scaled(
+                scaled_width, image_size.height(), QtCore.Qt.KeepAspectRatio))
+
+        image = image_reader.read()
+        if image.isNull():
+            logger.error(
+                f'Error reading {resource_file}: {image_reader.errorString()}')
+            return QtCore.QVariant()
+
+        if scaled_width:
+            image.setDevicePixelRatio(scaled_width / self.image_width)
+
+        self.image_cache[cache_key] = image
+        self.image_cache_bytes += image.byteCount()
+        while self.image_cache_bytes > self.image_cache_limit and len(self.image_cache) > 1:
+            self.image_cache_bytes -= self.image_cache.popitem(last=False)[1].byteCount()
+
+        return image
+
+    def rescale_images(self):
+        # Called following changes to the padding or the window width
+        text_width = self.get_text_width()
+        if text_width == self.image_width:
+            return
+
+        self.image_width = text_width
+        self.image_cache.clear()
+        self.image_cache_bytes = 0
+
+        if not self.document_images:
+            return
+
+        # Resources added to the document take precedence
+        # over the ones it has already loaded
+        for i in self.document_images.items():
+            this_image = self.get_image(i[1])
+            self.document().addResource(
+                QtGui.QTextDocument.ImageResource, QtCore.QUrl(i[0]), this_image)
+        self.document().markContentsDirty(0, self.document().characterCount())
+
     def wheelEvent(self, event):
         if self.text_mode in ('singlePage', 'doublePage'):
             vertical_pdelta = event.pixelDelta().y()
@@ -662,9 +785,8 @@ class PliantQTextBrowser(QtWidgets.QTextBrowser):
         current_block = cursor.block().blockNumber()
         current_chapter = self.parent.metadata['position']['current_chapter']
 
-        blocks_per_chapter = self.parent.metadata['position']['blocks_per_chapter']
-        block_sum = sum(blocks_per_chapter[:(current_chapter - 1)])
-        block_sum += current_block
+        block_offsets = self.parent.metadata['position']['block_offsets']
+        block_sum = block_offsets[current_chapter - 1] + current_block
 
         # This 'current_block' refers to the number of
         # blocks in the book upto this one
@@ -1102,19 +1224,8 @@ class PliantWidgetsCommonFunctions:
     def update_model(self):
         # We're updating the underlying model to have real-time
         # updates on the read status
-
-        # Set a baseline model index in case the item gets deleted
-        # E.g It's open in a tab and deleted from the library
-        model_index = None
-        start_index = self.main_window.lib_ref.libraryModel.index(0, 0)
-
-        # Find index of the model item that corresponds to the tab
-        model_index = self.main_window.lib_ref.libraryModel.match(
-            start_index,
-            QtCore.Qt.UserRole + 6,
-            self.pw.parent.metadata['hash'],
-            1, QtCore.Qt.MatchExactly)
-
+        # The library batches these and deals with books that
+        # have been deleted from it while open in a tab
         if self.are_we_doing_images_only:
             position_percentage = (
                 self.pw.parent.metadata['position']['current_chapter'] /
@@ -1125,9 +1236,10 @@ class PliantWidgetsCommonFunctions:
                 self.pw.parent.metadata['position']['total_blocks'])
 
         # Update position percentage
-        if model_index:
-            self.main_window.lib_ref.libraryModel.setData(
-                model_index[0], position_percentage, QtCore.Qt.UserRole + 7)
+        self.main_window.lib_ref.queue_book_update(
+            self.pw.parent.metadata['hash'],
+            QtCore.Qt.UserRole + 7,
+            position_percentage)
 
     def generate_combo_box_action(self, contextMenu):
         contextMenu.addSeparator()
@@ -21,6 +21,8 @@ import logging
 
 from PyQt5 import QtCore
 
+from lector.pathtrie import PathTrie
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,7 +45,11 @@ class DatabaseInit:
             'Bookmarks': 'BLOB',
             'CoverImage': 'BLOB',
             'Addition': 'TEXT',
-            'Annotations': 'BLOB'}
+            'Annotations': 'BLOB',
+            'DirectoryID': 'INTEGER',  # id of the library directory the book is in
+            'FileSize': 'INTEGER',
+            'PrefixHash': 'TEXT',  # MD5 of the first 32KB
+            'ContentHash': 'TEXT'}  # Versioned hash of the entire file, if known
 
         self.directories_table_columns = {
             'id': 'INTEGER PRIMARY KEY',
@@ -52,6 +58,15 @@ class DatabaseInit:
             'Tags': 'TEXT',
             'CheckState': 'INTEGER'}
 
+        # State of every directory as of the last library scan
+        # Subdirectories and Files are pickled
+        self.snapshots_table_columns = {
+            'Path': 'TEXT PRIMARY KEY',
+            'MTime': 'INTEGER',
+            'ScanTime': 'INTEGER',
+            'Subdirectories': 'BLOB',
+            'Files': 'BLOB'}
+
         if os.path.exists(self.database_path):
             self.check_columns()
         else:
@@ -69,9 +84,17 @@ class DatabaseInit:
             [i[0] + ' ' + i[1] for i in self.directories_table_columns.items()])
         self.database.execute(f"CREATE TABLE directories ({column_string})")
 
+        self.create_snapshots_table()
+
         self.database.commit()
         self.database.close()
 
+    def create_snapshots_table(self):
+        column_string = ', '.join(
+            [i[0] + ' ' + i[1] for i in self.snapshots_table_columns.items()])
+        self.database.execute(
+            f"CREATE TABLE IF NOT EXISTS snapshots ({column_string})")
+
     def check_columns(self):
         self.database = sqlite3.connect(self.database_path)
 
@@ -91,6 +114,24 @@ class DatabaseInit:
         if commit_required:
             self.database.commit()
 
+        # Tables added later on are created in place
+        self.create_snapshots_table()
+        self.database.commit()
+
+        # Existing books are assigned their library directories once
+        if 'DirectoryID' not in database_columns:
+            DatabaseFunctions(
+                os.path.dirname(self.database_path)).assign_book_directories(True)
+
+        # Existing books are identified by their prefix hash
+        if 'PrefixHash' not in database_columns:
+            self.database.execute(
+                "UPDATE books SET PrefixHash = Hash WHERE PrefixHash IS NULL")
+            self.database.commit()
+
+        # Their file sizes are left to the next library scan
+        # Going over every file here would hold up startup
+
 
 class DatabaseFunctions:
     def __init__(self, location_prefix):
@@ -98,7 +139,12 @@ class DatabaseFunctions:
         self.database = sqlite3.connect(database_path)
 
     def set_library_paths(self, data_iterable):
-        self.database.execute("DELETE FROM directories")
+        # Directories are updated in place so that their ids remain
+        # valid as the DirectoryID of the books inside them
+        existing_directories = {
+            i[0]: i[1] for i in self.database.execute(
+                "SELECT Path, id FROM directories").fetchall()}
+        retained_ids = set()
 
         for i in data_iterable:
             path = i[0]
@@ -109,14 +155,84 @@ class DatabaseFunctions:
             if not os.path.exists(path):
                 continue  # Remove invalid paths from the database
 
-            sql_command = (
-                "INSERT INTO directories (Path, Name, Tags, CheckState)\
-                 VALUES (?, ?, ?, ?)")
-            self.database.execute(sql_command, [path, name, tags, is_checked])
+            try:
+                directory_id = existing_directories[path]
+                sql_command = (
+                    "UPDATE directories SET Name = ?, Tags = ?, CheckState = ?\
+                     WHERE id = ?")
+                self.database.execute(
+                    sql_command, [name, tags, is_checked, directory_id])
+                retained_ids.add(directory_id)
+            except KeyError:
+                sql_command = (
+                    "INSERT INTO directories (Path, Name, Tags, CheckState)\
+                     VALUES (?, ?, ?, ?)")
+                self.database.execute(sql_command, [path, name, tags, is_checked])
+
+        deletable_ids = [
+            i for i in existing_directories.values() if i not in retained_ids]
+        if deletable_ids:
+            parameter_marks = ','.join(['?' for i in deletable_ids])
+            self.database.execute(
+                f"DELETE FROM directories WHERE id IN ({parameter_marks})",
+                deletable_ids)
+
+        # Library directories have changed. Every book needs to be reassigned.
+        self.assign_book_directories()
+
+        self.database.commit()
+        self.database.close()
+
+    def generate_directory_trie(self):
+        directory_trie = PathTrie()
+        for i in self.database.execute("SELECT id, Path FROM directories"):
+            directory_trie.insert(i[1], i[0])
+        return directory_trie
+
+    def assign_book_directories(self, commit=False):
+        # Resolves the library directory of each book once and stores it
+        # Books that aren't in any library directory get a NULL
+        directory_trie = self.generate_directory_trie()
+        all_books = self.database.execute("SELECT id, Path FROM books").fetchall()
+
+        update_data = [
+            (directory_trie.longest_prefix(os.path.dirname(i[1])), i[0])
+            for i in all_books if i[1]]
+        self.database.executemany(
+            "UPDATE books SET DirectoryID = ? WHERE id = ?", update_data)
+
+        if commit:
+            self.database.commit()
+            self.database.close()
 
+    def assign_file_sizes(self, file_sizes):
+        # file_sizes is an iterable of (file size, hash)
+        self.database.executemany(
+            "UPDATE books SET FileSize = ? WHERE Hash = ?", file_sizes)
         self.database.commit()
         self.database.close()
 
+    def relink_books(self, relinked_books):
+        # relinked_books is an iterable of (hash, new path, file size)
+        # Everything else about the book, including its reading state, is kept
+        # Returns {hash: id of the new library directory}
+        directory_trie = self.generate_directory_trie()
+        directory_ids = {}
+        update_data = []
+
+        for i in relinked_books:
+            directory_id = directory_trie.longest_prefix(os.path.dirname(i[1]))
+            directory_ids[i[0]] = directory_id
+            update_data.append((i[1], directory_id, i[2], i[0]))
+
+        self.database.executemany(
+            "UPDATE books SET Path = ?, DirectoryID = ?, FileSize = ? WHERE Hash = ?",
+            update_data)
+
+        self.database.commit()
+        self.database.close()
+        return directory_ids
+
     def add_to_database(self, data):
         # data is expected to be a dictionary
         # with keys corresponding to the book hash
@@ -128,6 +244,7 @@ class DatabaseFunctions:
         # current_time = datetime.datetime.now()
         current_datetime = QtCore.QDateTime().currentDateTime()
         current_datetime_bin = sqlite3.Binary(pickle.dumps(current_datetime))
+        directory_trie = self.generate_directory_trie()
 
         for i in data.items():
             book_hash = i[0]
@@ -138,6 +255,9 @@ class DatabaseFunctions:
             cover = i[1]['cover_image']
             isbn = i[1]['isbn']
             addition_mode = i[1]['addition_mode']
+            file_size = i[1]['size']
+            prefix_hash = i[1]['prefix_hash']
+            content_hash = i[1]['content_hash']
             tags = i[1]['tags']
             if tags:
                 # Is a list. Needs to be a string
@@ -146,11 +266,14 @@ class DatabaseFunctions:
                 # Is still a list. Needs to be None.
                 tags = None
 
+            directory_id = directory_trie.longest_prefix(os.path.dirname(path))
+
             sql_command_add = (
                 "INSERT OR REPLACE INTO \
                 books (Title, Author, Year, DateAdded, Path, \
-                ISBN, Tags, Hash, CoverImage, Addition) \
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+                ISBN, Tags, Hash, CoverImage, Addition, DirectoryID, FileSize, \
+                PrefixHash, ContentHash) \
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
 
             cover_insert = None
             if cover:
@@ -160,7 +283,8 @@ class DatabaseFunctions:
                 sql_command_add,
                 [title, author, year, current_datetime_bin,
                  path, isbn, tags, book_hash, cover_insert,
-                 addition_mode])
+                 addition_mode, directory_id, file_size,
+                 prefix_hash, content_hash])
 
         self.database.commit()
         self.database.close()
@@ -214,6 +338,35 @@ class DatabaseFunctions:
             error_string = 'SQLite is in wretched rebellion @ data fetching handling'
             logger.critical(error_string + f' {type(e).__name__} Arguments: {e.args}')
 
+    def fetch_snapshots(self):
+        # Returns {path: (mtime, scan_time, subdirectories, files)}
+        snapshots = {}
+        for i in self.database.execute(
+                "SELECT Path, MTime, ScanTime, Subdirectories, Files FROM snapshots"):
+            snapshots[i[0]] = (i[1], i[2], pickle.loads(i[3]), pickle.loads(i[4]))
+
+        self.database.close()
+        return snapshots
+
+    def update_snapshots(self, changed_snapshots, removed_paths):
+        # changed_snapshots is a dictionary in the format returned above
+        # removed_paths is an iterable of directories that no longer exist
+        update_data = [
+            (i[0], i[1][0], i[1][1],
+             sqlite3.Binary(pickle.dumps(i[1][2])),
+             sqlite3.Binary(pickle.dumps(i[1][3])))
+            for i in changed_snapshots.items()]
+        self.database.executemany(
+            "INSERT OR REPLACE INTO snapshots\
+             (Path, MTime, ScanTime, Subdirectories, Files)\
+             VALUES (?, ?, ?, ?, ?)", update_data)
+
+        self.database.executemany(
+            "DELETE FROM snapshots WHERE Path = ?", [(i,) for i in removed_paths])
+
+        self.database.commit()
+        self.database.close()
+
     def fetch_covers_only(self, hash_list):
         parameter_marks = ','.join(['?' for i in hash_list])
         sql_command = f"SELECT Hash, CoverImage from books WHERE Hash IN ({parameter_marks})"
@@ -257,10 +410,18 @@ class DatabaseFunctions:
         if column_name == '*':
             self.database.execute(
                 "DELETE FROM books WHERE NOT Addition = 'manual'")
+            self.database.execute("DELETE FROM snapshots")
         else:
-            sql_command = f"DELETE FROM books WHERE {column_name} = ?"
-            for i in target_data:
-                self.database.execute(sql_command, (i,))
+            # Deletion is a single statement per chunk of values
+            # The chunk size is kept under SQLite's default variable limit
+            target_data = list(target_data)
+            chunk_size = 999
+            for i in range(0, len(target_data), chunk_size):
+                this_chunk = target_data[i:i + chunk_size]
+                parameter_marks = ','.join(['?' for j in this_chunk])
+                sql_command = (
+                    f"DELETE FROM books WHERE {column_name} IN ({parameter_marks})")
+                self.database.execute(sql_command, this_chunk)
 
         self.database.commit()
         self.database.close()
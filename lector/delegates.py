@@ -24,11 +24,17 @@ logger = logging.getLogger(__name__)
 
 
 class LibraryDelegate(QtWidgets.QStyledItemDelegate):
-    def __init__(self, temp_dir, parent=None):
+    def __init__(self, parent=None):
         super(LibraryDelegate, self).__init__(parent)
-        self.temp_dir = temp_dir
         self.parent = parent
 
+        # The shadow pixmap currently is set to 420 x 600
+        # It is scaled once here instead of on every paint
+        shadow_pixmap = QtGui.QPixmap()
+        shadow_pixmap.load(':/images/gray-shadow.png')
+        self.shadow_pixmap = shadow_pixmap.scaled(
+            160, 230, QtCore.Qt.IgnoreAspectRatio)
+
     def paint(self, painter, option, index):
         # This is a hint for the future
         # Color icon slightly red
@@ -39,16 +45,12 @@ class LibraryDelegate(QtWidgets.QStyledItemDelegate):
         file_exists = index.data(QtCore.Qt.UserRole + 5)
         position_percent = index.data(QtCore.Qt.UserRole + 7)
 
-        # The shadow pixmap currently is set to 420 x 600
         # Only draw the cover shadow in case the setting is enabled
         if self.parent.settings['cover_shadows']:
-            shadow_pixmap = QtGui.QPixmap()
-            shadow_pixmap.load(':/images/gray-shadow.png')
-            shadow_pixmap = shadow_pixmap.scaled(160, 230, QtCore.Qt.IgnoreAspectRatio)
             shadow_x = option.rect.topLeft().x() + 10
             shadow_y = option.rect.topLeft().y() - 5
             painter.setOpacity(.7)
-            painter.drawPixmap(shadow_x, shadow_y, shadow_pixmap)
+            painter.drawPixmap(shadow_x, shadow_y, self.shadow_pixmap)
             painter.setOpacity(1)
 
         if not file_exists:
@@ -56,7 +58,8 @@ class LibraryDelegate(QtWidgets.QStyledItemDelegate):
             QtWidgets.QStyledItemDelegate.paint(self, painter, option, index)
             painter.setOpacity(1)
             read_icon = pie_chart.pixmapper(
-                -1, None, self.parent.settings['consider_read_at'], 36)
+                -1, self.parent.settings['consider_read_at'], 36,
+                painter.device().devicePixelRatioF())
             x_draw = option.rect.bottomRight().x() - 30
             y_draw = option.rect.bottomRight().y() - 35
             painter.drawPixmap(x_draw, y_draw, read_icon)
@@ -66,7 +69,8 @@ class LibraryDelegate(QtWidgets.QStyledItemDelegate):
 
         if position_percent:
             read_icon = pie_chart.pixmapper(
-                position_percent, self.temp_dir, self.parent.settings['consider_read_at'], 36)
+                position_percent, self.parent.settings['consider_read_at'], 36,
+                painter.device().devicePixelRatioF())
 
             x_draw = option.rect.bottomRight().x() - 30
             y_draw = option.rect.bottomRight().y() - 35
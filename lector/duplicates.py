@@ -0,0 +1,131 @@
+# This file is a part of Lector, a Qt based ebook reader
+# Copyright (C) 2017-2019 BasioMeusPuga
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import unicodedata
+
+
+class DuplicateIndex:
+    # Every book is filed under a handful of keys:
+    # Its content hash, its ISBN, and its normalized title + author
+    # Books that share any key are duplicates of each other.
+    # Keys are hashed, so adding or removing a book never
+    # requires comparing it against the rest of the library.
+    def __init__(self):
+        self.book_keys = {}  # Book hash: keys
+        self.key_books = {}  # Key: set of book hashes
+
+    def clear(self):
+        self.book_keys = {}
+        self.key_books = {}
+
+    def add_book(self, book_hash, title, author, isbn, content_hash):
+        self.remove_book(book_hash)
+
+        book_keys = set()
+        if content_hash:
+            book_keys.add(('content', content_hash))
+
+        normalized_isbn = normalize_isbn(isbn)
+        if normalized_isbn:
+            book_keys.add(('isbn', normalized_isbn))
+
+        # Word order doesn't matter for authors
+        # "Tolkien, J. R. R." and "J.R.R. Tolkien" are the same person
+        normalized_title = normalize_text(title)
+        if normalized_title:
+            normalized_author = ' '.join(sorted(normalize_text(author).split()))
+            book_keys.add(('title', normalized_title, normalized_author))
+
+        self.book_keys[book_hash] = book_keys
+        for i in book_keys:
+            try:
+                self.key_books[i].add(book_hash)
+            except KeyError:
+                self.key_books[i] = {book_hash}
+
+    def remove_book(self, book_hash):
+        try:
+            book_keys = self.book_keys.pop(book_hash)
+        except KeyError:
+            return
+
+        for i in book_keys:
+            this_key = self.key_books[i]
+            this_key.discard(book_hash)
+            if not this_key:
+                del self.key_books[i]
+
+    def duplicate_hashes(self):
+        return set(
+            j for i in self.key_books.values() if len(i) > 1 for j in i)
+
+    def deletion_groups(self):
+        # Returns lists of book hashes that are offered up for deletion
+        # Unlike the filter, groups are never merged into each other.
+        # Identical files go first, then ISBNs, then titles. Books that turn
+        # up later join the group of whichever of their matches came first.
+        key_priority = {'content': 0, 'isbn': 1, 'title': 2}
+        book_groups = {}  # Book hash: the group it's in
+        groups = []
+
+        for i in sorted(self.key_books, key=lambda x: (key_priority[x[0]], x)):
+            these_books = sorted(self.key_books[i])
+            ungrouped_books = [j for j in these_books if j not in book_groups]
+            if len(these_books) < 2 or not ungrouped_books:
+                continue
+
+            try:
+                this_group = next(
+                    book_groups[j] for j in these_books if j in book_groups)
+            except StopIteration:
+                this_group = []
+                groups.append(this_group)
+
+            for j in ungrouped_books:
+                this_group.append(j)
+                book_groups[j] = this_group
+
+        return groups
+
+
+def normalize_text(text):
+    # Case, accents, and punctuation are all discarded
+    if not text:
+        return ''
+
+    text = unicodedata.normalize('NFKD', str(text)).casefold()
+    text = ''.join(i for i in text if not unicodedata.combining(i))
+    return ' '.join(re.findall(r'[^\W_]+', text))
+
+
+def normalize_isbn(isbn):
+    # Everything is converted to ISBN-13
+    if not isbn:
+        return None
+
+    isbn = re.sub(r'[^0-9X]', '', str(isbn).upper())
+
+    if len(isbn) == 13 and isbn.isdigit():
+        return isbn
+
+    if len(isbn) == 10 and isbn[:9].isdigit():
+        isbn = '978' + isbn[:9]
+        check_sum = sum(
+            int(j) * (3 if i % 2 else 1) for i, j in enumerate(isbn))
+        return isbn + str((10 - check_sum % 10) % 10)
+
+    return None
@@ -0,0 +1,93 @@
+# This file is a part of Lector, a Qt based ebook reader
+# Copyright (C) 2017-2019 BasioMeusPuga
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from PyQt5 import QtWidgets, QtCore
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicatesUI(QtWidgets.QDialog):
+    # Lists every group of duplicates with the suggested copy checked
+    # Checked books are kept, and everything else is deleted
+    def __init__(self, parent, surplus_groups):
+        super(DuplicatesUI, self).__init__(parent)
+        self._translate = QtCore.QCoreApplication.translate
+        self.setWindowTitle(self._translate('DuplicatesUI', 'Delete Duplicates'))
+        self.resize(800, 500)
+
+        library_model = parent.lib_ref.libraryModel
+
+        self.duplicatesTree = QtWidgets.QTreeWidget()
+        self.duplicatesTree.setHeaderLabels((
+            self._translate('DuplicatesUI', 'Title'),
+            self._translate('DuplicatesUI', 'Author'),
+            self._translate('DuplicatesUI', 'Path')))
+
+        for keep_index, surplus_indexes in surplus_groups:
+            groupItem = QtWidgets.QTreeWidgetItem(
+                self.duplicatesTree,
+                [str(library_model.data(keep_index, QtCore.Qt.UserRole) or '')])
+            groupItem.setFirstColumnSpanned(True)
+
+            for i in [keep_index] + surplus_indexes:
+                bookItem = QtWidgets.QTreeWidgetItem(groupItem, [
+                    str(library_model.data(i, role) or '') for role in (
+                        QtCore.Qt.UserRole,
+                        QtCore.Qt.UserRole + 1,
+                        QtCore.Qt.UserRole + 13)])
+
+                # Rows may come and go while the dialog is open
+                bookItem.setData(
+                    0, QtCore.Qt.UserRole, QtCore.QPersistentModelIndex(i))
+
+                check_state = QtCore.Qt.Unchecked
+                if i is keep_index:
+                    check_state = QtCore.Qt.Checked
+                bookItem.setCheckState(0, check_state)
+
+        self.duplicatesTree.expandAll()
+        self.duplicatesTree.resizeColumnToContents(0)
+
+        infoLabel = QtWidgets.QLabel(self._translate(
+            'DuplicatesUI', 'Checked books are kept. Everything else is deleted.'))
+
+        buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttonBox.accepted.connect(self.accept)
+        buttonBox.rejected.connect(self.reject)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(infoLabel)
+        layout.addWidget(self.duplicatesTree)
+        layout.addWidget(buttonBox)
+
+    def deletable_indexes(self):
+        # Indexes of the books that were left unchecked
+        deletable_indexes = []
+        for i in range(self.duplicatesTree.topLevelItemCount()):
+            groupItem = self.duplicatesTree.topLevelItem(i)
+            for j in range(groupItem.childCount()):
+                bookItem = groupItem.child(j)
+                if bookItem.checkState(0) == QtCore.Qt.Checked:
+                    continue
+
+                model_index = bookItem.data(0, QtCore.Qt.UserRole)
+                if model_index.isValid():
+                    deletable_indexes.append(QtCore.QModelIndex(model_index))
+
+        return deletable_indexes
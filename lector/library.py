@@ -15,13 +15,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
 import pickle
+import locale
 import logging
-import pathlib
+import unicodedata
 
 from PyQt5 import QtGui, QtCore
 
 from lector import database
+from lector.pathtrie import PathTrie
+from lector.duplicates import DuplicateIndex
+from lector.threaded import BackGroundFileCheck
 from lector.models import TableProxyModel, ItemProxyModel
 
 logger = logging.getLogger(__name__)
@@ -35,16 +40,67 @@ class Library:
         self.tableProxyModel = None
         self._translate = QtCore.QCoreApplication.translate
 
+        # Sorting happens on precomputed integer ranks
+        # Keys are the UserRole of the data, values the UserRole of its rank
+        self.sort_rank_roles = {
+            QtCore.Qt.UserRole: QtCore.Qt.UserRole + 14,       # Title
+            QtCore.Qt.UserRole + 1: QtCore.Qt.UserRole + 15,   # Author
+            QtCore.Qt.UserRole + 2: QtCore.Qt.UserRole + 16,   # Year
+            QtCore.Qt.UserRole + 9: QtCore.Qt.UserRole + 17,   # Date added
+            QtCore.Qt.UserRole + 12: QtCore.Qt.UserRole + 18,  # Last accessed
+            QtCore.Qt.UserRole + 7: QtCore.Qt.UserRole + 19}   # Position percentage
+
+        # Ranks are only regenerated for roles that have changed
+        self.dirty_rank_roles = set(self.sort_rank_roles)
+
+        # Text: collation key of titles and authors
+        # These only depend on the text, so they're kept across rebuilds
+        self.collation_keys = {}
+
+        # Pruning more than these many separate row ranges resets the model
+        self.prune_reset_threshold = 50
+
+        # Book hash -> QPersistentModelIndex of its row in the libraryModel
+        # Persistent indexes are kept current by the model itself
+        self.hash_index = {}
+
+        # Books are filed for duplicate detection as rows come and go
+        self.duplicate_index = DuplicateIndex()
+
+        # Updates from open tabs are collected here and applied
+        # to the libraryModel once per tick
+        self.pending_updates = {}
+        self.update_timer = QtCore.QTimer()
+        self.update_timer.setSingleShot(True)
+        self.update_timer.timeout.connect(self.flush_book_updates)
+
+        # Existence of files is checked in the background
+        # Focus changes re-check at most once per this many msecs
+        self.file_check_thread = None
+        self.file_check_time = QtCore.QElapsedTimer()
+        self.file_check_interval = 60000
+
     def generate_model(self, mode, parsed_books=None, is_database_ready=True):
         if mode == 'build':
             self.libraryModel = QtGui.QStandardItemModel()
             self.libraryModel.setColumnCount(10)
+            self.libraryModel.dataChanged.connect(self.invalidate_changed_ranks)
+            self.libraryModel.rowsInserted.connect(self.invalidate_sort_ranks)
+            self.invalidate_sort_ranks()
+
+            self.libraryModel.rowsInserted.connect(self.index_rows)
+            self.libraryModel.rowsAboutToBeRemoved.connect(self.unindex_rows)
+            self.libraryModel.modelReset.connect(self.rebuild_hash_index)
+            self.libraryModel.dataChanged.connect(self.reindex_duplicates)
+            self.hash_index = {}
+            self.duplicate_index.clear()
+            self.pending_updates = {}
 
             books = database.DatabaseFunctions(
                 self.main_window.database_path).fetch_data(
                     ('Title', 'Author', 'Year', 'DateAdded', 'Path',
                      'Position', 'ISBN', 'Tags', 'Hash', 'LastAccessed',
-                     'Addition'),
+                     'Addition', 'DirectoryID', 'ContentHash'),
                     'books',
                     {'Title': ''},
                     'LIKE')
@@ -71,7 +127,8 @@ class Library:
 
                 books.append([
                     i[1]['title'], i[1]['author'], i[1]['year'], current_qdatetime,
-                    i[1]['path'], None, i[1]['isbn'], _tags, i[0], None, i[1]['addition_mode']])
+                    i[1]['path'], None, i[1]['isbn'], _tags, i[0], None,
+                    i[1]['addition_mode'], None, i[1]['content_hash']])
 
         else:
             return
@@ -84,6 +141,8 @@ class Library:
             year = i[2]
             path = i[4]
             addition_mode = i[10]
+            directory_id = i[11]
+            content_hash = i[12]
 
             last_accessed = i[9]
             if last_accessed and not isinstance(last_accessed, QtCore.QDateTime):
@@ -107,10 +166,9 @@ class Library:
                 position = pickle.loads(position)
                 position_perc = generate_position_percentage(position)
 
-            try:
-                file_exists = os.path.exists(path)
-            except UnicodeEncodeError:
-                print('Library: Unicode encoding error')
+            # Files are assumed to exist until the background
+            # check started at the end of a build says otherwise
+            file_exists = True
 
             all_metadata = {
                 'title': title,
@@ -124,6 +182,8 @@ class Library:
                 'hash': i[8],
                 'last_accessed': last_accessed,
                 'addition_mode': addition_mode,
+                'directory_id': directory_id,
+                'content_hash': content_hash,
                 'file_exists': file_exists}
 
             author_string = self._translate('Library', 'Author')
@@ -162,11 +222,19 @@ class Library:
 
             self.libraryModel.appendRow(item)
 
+        if mode == 'build':
+            self.start_file_check()
+
         # The is_database_ready boolean is required when a new thread sends
         # books here for model generation.
         if not self.main_window.settings['perform_culling'] and is_database_ready:
             self.main_window.cover_functions.load_all_covers()
 
+    def add_parsed_books(self, parsed_books):
+        # Books parsed by a background thread
+        # The database is still being written to at this point
+        self.generate_model('addition', parsed_books, False)
+
     def generate_proxymodels(self):
         self.itemProxyModel = ItemProxyModel()
         self.itemProxyModel.setSourceModel(self.libraryModel)
@@ -176,7 +244,6 @@ class Library:
         self.main_window.listView.setModel(self.itemProxyModel)
 
         self.tableProxyModel = TableProxyModel(
-            self.main_window.temp_dir.path(),
             self.main_window.tableView.horizontalHeader(),
             self.main_window.settings['consider_read_at'])
         self.tableProxyModel.setSourceModel(self.libraryModel)
@@ -185,13 +252,311 @@ class Library:
 
         self.update_proxymodels()
 
+    def index_rows(self, parent, first, last):
+        for i in range(first, last + 1):
+            model_index = self.libraryModel.index(i, 0)
+            book_hash = self.libraryModel.data(model_index, QtCore.Qt.UserRole + 6)
+            self.hash_index[book_hash] = QtCore.QPersistentModelIndex(model_index)
+            self.index_duplicates(model_index)
+
+    def unindex_rows(self, parent, first, last):
+        for i in range(first, last + 1):
+            book_hash = self.libraryModel.data(
+                self.libraryModel.index(i, 0), QtCore.Qt.UserRole + 6)
+            self.hash_index.pop(book_hash, None)
+            self.duplicate_index.remove_book(book_hash)
+
+    def rebuild_hash_index(self):
+        self.hash_index = {}
+        self.duplicate_index.clear()
+        row_count = self.libraryModel.rowCount()
+        if row_count:
+            self.index_rows(None, 0, row_count - 1)
+
+    def index_duplicates(self, model_index):
+        item_metadata = self.libraryModel.data(model_index, QtCore.Qt.UserRole + 3)
+        self.duplicate_index.add_book(
+            self.libraryModel.data(model_index, QtCore.Qt.UserRole + 6),
+            self.libraryModel.data(model_index, QtCore.Qt.UserRole),
+            self.libraryModel.data(model_index, QtCore.Qt.UserRole + 1),
+            item_metadata['isbn'],
+            item_metadata['content_hash'])
+
+    def reindex_duplicates(self, top_left, bottom_right, roles=None):
+        # Only edits to the title, author, or metadata matter
+        relevant_roles = (
+            QtCore.Qt.UserRole, QtCore.Qt.UserRole + 1, QtCore.Qt.UserRole + 3)
+        if roles and not any(i in relevant_roles for i in roles):
+            return
+
+        for i in range(top_left.row(), bottom_right.row() + 1):
+            self.index_duplicates(self.libraryModel.index(i, 0))
+
+    def surplus_duplicates(self):
+        # Returns (index to keep, [surplus indexes]) for each
+        # group of duplicates. Whatever's being read is kept, followed by
+        # whatever's been in the library longest. Nothing is deleted from
+        # here. The user gets to confirm or change the choice first.
+        def keep_priority(model_index):
+            progress = self.libraryModel.data(model_index, QtCore.Qt.UserRole + 7)
+            last_accessed = self.libraryModel.data(model_index, QtCore.Qt.UserRole + 12)
+            date_added = self.libraryModel.data(model_index, QtCore.Qt.UserRole + 9)
+
+            last_accessed_msecs = 0
+            if isinstance(last_accessed, QtCore.QDateTime):
+                last_accessed_msecs = last_accessed.toMSecsSinceEpoch()
+            date_added_msecs = 0
+            if isinstance(date_added, QtCore.QDateTime):
+                date_added_msecs = date_added.toMSecsSinceEpoch()
+
+            return (progress or 0, last_accessed_msecs, -date_added_msecs)
+
+        surplus_groups = []
+        for book_hashes in self.duplicate_index.deletion_groups():
+            group_indexes = [self.index_for_hash(i) for i in book_hashes]
+            group_indexes = [i for i in group_indexes if i is not None]
+            if len(group_indexes) < 2:
+                continue
+
+            group_indexes.sort(key=keep_priority, reverse=True)
+            surplus_groups.append((group_indexes[0], group_indexes[1:]))
+
+        return surplus_groups
+
+    def index_for_hash(self, book_hash):
+        # Returns None in case the book isn't in the library
+        # E.g. It's open in a tab and has been deleted from the library
+        try:
+            model_index = self.hash_index[book_hash]
+        except KeyError:
+            return None
+
+        if not model_index.isValid():
+            return None
+        return QtCore.QModelIndex(model_index)
+
+    def queue_book_update(self, book_hash, role, value):
+        # Position and last accessed updates arrive on every chapter change
+        # and scroll. Only the latest value for each role is retained.
+        try:
+            self.pending_updates[book_hash][role] = value
+        except KeyError:
+            self.pending_updates[book_hash] = {role: value}
+
+        if not self.update_timer.isActive():
+            self.update_timer.start(500)
+
+    def flush_book_updates(self):
+        self.update_timer.stop()
+        if not self.pending_updates or not self.libraryModel:
+            return
+
+        # Signals are blocked while the updates are applied.
+        # See emit_rows_changed for what is sent out afterwards.
+        updated_rows = []
+        updated_roles = set()
+        self.libraryModel.blockSignals(True)
+        for book_hash, updates in self.pending_updates.items():
+            model_index = self.index_for_hash(book_hash)
+            if model_index is None:
+                continue
+
+            for role, value in updates.items():
+                self.libraryModel.setData(model_index, value, role)
+                updated_roles.add(role)
+            updated_rows.append(model_index.row())
+        self.libraryModel.blockSignals(False)
+        self.pending_updates = {}
+
+        self.emit_rows_changed(updated_rows, list(updated_roles))
+
+    def emit_rows_changed(self, rows, roles):
+        # Stands in for the signals of setData calls made with signals blocked
+        # Everything that listens to the libraryModel works off dataChanged:
+        # the sort rank invalidation, the duplicate index (which checks
+        # the roles), both proxy models, and the table proxy's display cache.
+        # Nothing is connected to itemChanged.
+        # One notification goes out per run of adjacent rows so that
+        # rows in between that didn't change are left alone.
+        if not rows:
+            return
+
+        for range_start, range_end in row_ranges(rows):
+            self.libraryModel.dataChanged.emit(
+                self.libraryModel.index(range_start, 0),
+                self.libraryModel.index(range_end, 0),
+                roles)
+
+    def start_file_check(self):
+        if not self.libraryModel:
+            return
+
+        if self.file_check_thread and self.file_check_thread.isRunning():
+            return
+
+        hashes_and_paths = []
+        for i in range(self.libraryModel.rowCount()):
+            this_index = self.libraryModel.index(i, 0)
+            hashes_and_paths.append((
+                self.libraryModel.data(this_index, QtCore.Qt.UserRole + 6),
+                self.libraryModel.data(this_index, QtCore.Qt.UserRole + 13)))
+
+        self.file_check_time.start()
+        self.file_check_thread = BackGroundFileCheck(hashes_and_paths)
+        self.file_check_thread.files_checked.connect(self.apply_file_check)
+        self.file_check_thread.start()
+
+    def refresh_file_check(self, application_state=None):
+        # Triggered when the application regains focus
+        if application_state not in (None, QtCore.Qt.ApplicationActive):
+            return
+
+        if (self.file_check_time.isValid() and
+                self.file_check_time.elapsed() < self.file_check_interval):
+            return
+
+        self.start_file_check()
+
+    def apply_file_check(self, results):
+        updated_rows = []
+        self.libraryModel.blockSignals(True)
+        for book_hash, file_exists in results.items():
+            model_index = self.index_for_hash(book_hash)
+            if model_index is None:
+                continue
+
+            if self.libraryModel.data(model_index, QtCore.Qt.UserRole + 5) == file_exists:
+                continue
+
+            all_metadata = self.libraryModel.data(model_index, QtCore.Qt.UserRole + 3)
+            all_metadata['file_exists'] = file_exists
+            self.libraryModel.setData(model_index, all_metadata, QtCore.Qt.UserRole + 3)
+            self.libraryModel.setData(model_index, file_exists, QtCore.Qt.UserRole + 5)
+            updated_rows.append(model_index.row())
+        self.libraryModel.blockSignals(False)
+
+        self.emit_rows_changed(
+            updated_rows, [QtCore.Qt.UserRole + 3, QtCore.Qt.UserRole + 5])
+
+    def relink_books(self, relinked_books):
+        # [(book_hash, new_path, directory_id), ...]
+        for i in relinked_books:
+            self.relink_book(*i)
+
+    def relink_book(self, book_hash, new_path, directory_id):
+        # The book has been found at a new path. Everything else stays.
+        model_index = self.index_for_hash(book_hash)
+        if model_index is None:
+            return
+
+        item = self.libraryModel.itemFromIndex(model_index)
+        item_metadata = item.data(QtCore.Qt.UserRole + 3)
+        item_metadata['path'] = new_path
+        item_metadata['directory_id'] = directory_id
+        item_metadata['file_exists'] = True
+
+        item.setData(item_metadata, QtCore.Qt.UserRole + 3)
+        item.setData(True, QtCore.Qt.UserRole + 5)
+        item.setData(new_path, QtCore.Qt.UserRole + 13)
+
+    def invalidate_sort_ranks(self, *args):
+        self.dirty_rank_roles = set(self.sort_rank_roles)
+
+    def invalidate_changed_ranks(self, top_left, bottom_right, roles=None):
+        # Changes that carry their roles only invalidate the ranks of those
+        # E.g. Progress updates from a tab leave titles and authors alone
+        if not roles:
+            self.invalidate_sort_ranks()
+            return
+        self.dirty_rank_roles.update(i for i in roles if i in self.sort_rank_roles)
+
+    def generate_sort_ranks(self):
+        # Each sortable field is ranked once across the whole library and
+        # the rank is stored in the model as an integer. The proxy models
+        # then sort on these instead of fetching and case folding strings
+        # or comparing QDateTimes for every single comparison
+        # Ranks are only regenerated for roles that have changed since
+        self.flush_book_updates()
+        if not self.dirty_rank_roles or not self.libraryModel:
+            return
+
+        def text_key(value):
+            # Books without a title or author go first
+            if value is None:
+                value = ''
+            value = str(value)
+            try:
+                return self.collation_keys[value]
+            except KeyError:
+                self.collation_keys[value] = collation_key(value)
+                return self.collation_keys[value]
+
+        def date_key(value):
+            return value.toMSecsSinceEpoch()
+
+        sort_keys = {
+            QtCore.Qt.UserRole: text_key,
+            QtCore.Qt.UserRole + 1: text_key,
+            QtCore.Qt.UserRole + 2: int,
+            QtCore.Qt.UserRole + 9: date_key,
+            QtCore.Qt.UserRole + 12: date_key,
+            QtCore.Qt.UserRole + 7: float}
+
+        all_items = [
+            self.libraryModel.item(i, 0) for i in range(self.libraryModel.rowCount())]
+
+        # Rank changes are not supposed to trigger anything in the
+        # proxy models. They're invalidated in one go at the end.
+        # No other listener has any use for ranks: they aren't displayed,
+        # aren't part of the duplicate index, and nothing is connected
+        # to itemChanged. A dataChanged here would only mark the ranks
+        # dirty again.
+        self.libraryModel.blockSignals(True)
+
+        for data_role in self.dirty_rank_roles:
+            rank_role = self.sort_rank_roles[data_role]
+            sort_key = sort_keys[data_role]
+            keyed_items = []
+            for this_item in all_items:
+                this_data = this_item.data(data_role)
+                try:
+                    keyed_items.append((sort_key(this_data), this_item))
+                except (TypeError, ValueError, AttributeError):
+                    # Missing values go before everything else
+                    this_item.setData(0, rank_role)
+
+            keyed_items.sort(key=lambda x: x[0])
+
+            # Equal values get equal ranks
+            rank = 0
+            previous_key = None
+            for this_key, this_item in keyed_items:
+                if rank == 0 or this_key != previous_key:
+                    rank += 1
+                    previous_key = this_key
+                this_item.setData(rank, rank_role)
+
+        self.libraryModel.blockSignals(False)
+        self.dirty_rank_roles = set()
+
+        for i in (self.itemProxyModel, self.tableProxyModel):
+            if i:
+                i.invalidate()
+
     def update_proxymodels(self):
+        self.generate_sort_ranks()
+
         # Table proxy model
         self.tableProxyModel.invalidateFilter()
+        duplicate_hashes = None
+        if self.main_window.show_duplicates_only:
+            duplicate_hashes = self.duplicate_index.duplicate_hashes()
+
         self.tableProxyModel.setFilterParams(
             self.main_window.libraryToolBar.searchBar.text(),
             self.main_window.active_library_filters,
-            0) # This doesn't need to know the sorting box position
+            0,  # This doesn't need to know the sorting box position
+            duplicate_hashes)
         self.tableProxyModel.setFilterFixedString(
             self.main_window.libraryToolBar.searchBar.text())
         # ^^^ This isn't needed, but it forces a model update every time the
@@ -205,7 +570,8 @@ class Library:
         self.itemProxyModel.setFilterParams(
             self.main_window.libraryToolBar.searchBar.text(),
             self.main_window.active_library_filters,
-            self.main_window.libraryToolBar.sortingBox.currentIndex())
+            self.main_window.libraryToolBar.sortingBox.currentIndex(),
+            duplicate_hashes)
         self.itemProxyModel.setFilterFixedString(
             self.main_window.libraryToolBar.searchBar.text())
 
@@ -228,10 +594,12 @@ class Library:
             4: 12,
             5: 7}
 
-        # Sorting according to roles and the drop down in the library toolbar
+        # Sorting according to the drop down in the library toolbar
+        # The proxy model sorts on the rank of each role, not the role itself
         self.itemProxyModel.setSortRole(
-            QtCore.Qt.UserRole +
-            sort_roles[self.main_window.libraryToolBar.sortingBox.currentIndex()])
+            self.sort_rank_roles[
+                QtCore.Qt.UserRole +
+                sort_roles[self.main_window.libraryToolBar.sortingBox.currentIndex()]])
 
         # This can be expanded to other fields by appending to the list
         sort_order = QtCore.Qt.AscendingOrder
@@ -242,59 +610,52 @@ class Library:
         self.main_window.start_culling_timer()
 
     def generate_library_tags(self):
+        # Books carry the id of their library directory (resolved when they're
+        # added to the database), so this is a lookup per book
         db_library_directories = database.DatabaseFunctions(
             self.main_window.database_path).fetch_data(
-                ('Path', 'Name', 'Tags'),
+                ('id', 'Path', 'Name', 'Tags'),
                 'directories',  # This checks the directories table NOT the book one
                 {'Path': ''},
                 'LIKE')
 
-        if db_library_directories:  # Empty database / table
-            library_directories = {
-                i[0]: (i[1], i[2]) for i in db_library_directories}
-
-        else:
-            db_library_directories = database.DatabaseFunctions(
-                self.main_window.database_path).fetch_data(
-                    ('Path',),
-                    'books', # THIS CHECKS THE BOOKS TABLE
-                    {'Path': ''},
-                    'LIKE')
+        # A file is assigned a 'manually added' tag in case it isn't
+        # in any designated library directory
+        added_string = self._translate('Library', 'manually added')
+        manually_added = (added_string.lower(), None)
 
-            library_directories = None
-            if db_library_directories:
-                library_directories = {
-                    i[0]: (None, None) for i in db_library_directories}
-
-        def get_tags(all_metadata):
-            path = os.path.dirname(all_metadata['path'])
-            path_ref = pathlib.Path(path)
-
-            for i in library_directories:
-                if i == path or pathlib.Path(i) in path_ref.parents:
-                    directory_name = library_directories[i][0]
-                    if directory_name:
-                        directory_name = directory_name.lower()
-                    else:
-                        directory_name = i.rsplit(os.sep)[-1].lower()
-
-                    directory_tags = library_directories[i][1]
-                    if directory_tags:
-                        directory_tags = directory_tags.lower()
+        library_directories = {}
+        directory_trie = PathTrie()
+        if db_library_directories:  # Empty database / table
+            for i in db_library_directories:
+                directory_name = i[2]
+                if directory_name:
+                    directory_name = directory_name.lower()
+                else:
+                    directory_name = i[1].rsplit(os.sep)[-1].lower()
 
-                    return directory_name, directory_tags
+                directory_tags = i[3]
+                if directory_tags:
+                    directory_tags = directory_tags.lower()
 
-            # A file is assigned a 'manually added' tag in case it isn't
-            # in any designated library directory
-            added_string = self._translate('Library', 'manually added')
-            return added_string.lower(), None
+                library_directories[i[0]] = (directory_name, directory_tags)
+                directory_trie.insert(i[1], i[0])
 
         # Generate tags for the QStandardItemModel
         # This isn't triggered for an empty view model
         for i in range(self.libraryModel.rowCount()):
             this_item = self.libraryModel.item(i, 0)
             all_metadata = this_item.data(QtCore.Qt.UserRole + 3)
-            directory_name, directory_tags = get_tags(all_metadata)
+
+            # Books that haven't made it to the database yet
+            # are resolved the long way around
+            directory_id = all_metadata.get('directory_id')
+            if directory_id not in library_directories:
+                directory_id = directory_trie.longest_prefix(
+                    os.path.dirname(all_metadata['path']))
+
+            directory_name, directory_tags = library_directories.get(
+                directory_id, manually_added)
 
             this_item.setData(directory_name, QtCore.Qt.UserRole + 10)
             this_item.setData(directory_tags, QtCore.Qt.UserRole + 11)
@@ -304,34 +665,125 @@ class Library:
         # All files in unselected directories will have to be removed
         # from both of the models
         # They will also have to be deleted from the library
-        invalid_paths = []
-        deletable_persistent_indexes = []
+        valid_paths = set(valid_paths)
+        self.prune_books(lambda book_path, book_hash: book_path not in valid_paths)
+
+    def prune_paths(self, invalid_paths, replaced_hashes):
+        # To be executed when only the changes to library folders are known
+        # Books at invalid_paths are removed, as are the outdated
+        # entries of books that have been modified in place
+        invalid_paths = set(invalid_paths)
+
+        def is_invalid(book_path, book_hash):
+            if book_path in invalid_paths:
+                return True
+            try:
+                return replaced_hashes[book_path] != book_hash
+            except KeyError:
+                return False
+
+        self.prune_books(is_invalid)
+
+    def prune_books(self, is_invalid):
+        # Manually added books are never pruned
+        invalid_hashes = []
+        deletable_rows = []
 
         for i in range(self.libraryModel.rowCount()):
             item = self.libraryModel.item(i)
 
             item_metadata = item.data(QtCore.Qt.UserRole + 3)
             book_path = item_metadata['path']
+            book_hash = item.data(QtCore.Qt.UserRole + 6)
             try:
                 addition_mode = item_metadata['addition_mode']
             except KeyError:
                 addition_mode = 'automatic'
                 logger.error('Libary: Error setting addition mode for prune')
 
-            if (book_path not in valid_paths and
+            if (is_invalid(book_path, book_hash) and
                     (addition_mode != 'manual' or addition_mode is None)):
 
-                invalid_paths.append(book_path)
-                deletable_persistent_indexes.append(
-                    QtCore.QPersistentModelIndex(item.index()))
+                invalid_hashes.append(book_hash)
+                deletable_rows.append(i)
+
+        if deletable_rows:
+            self.remove_rows(deletable_rows)
 
-        if deletable_persistent_indexes:
-            for i in deletable_persistent_indexes:
-                self.libraryModel.removeRow(i.row())
+            # Remove invalid books from the database as well
+            # Paths aren't unique in case a book has been modified in place
+            database.DatabaseFunctions(
+                self.main_window.database_path).delete_from_database('Hash', invalid_hashes)
 
-        # Remove invalid paths from the database as well
-        database.DatabaseFunctions(
-            self.main_window.database_path).delete_from_database('Path', invalid_paths)
+    def remove_rows(self, rows):
+        # Rows are removed from the bottom up in contiguous ranges
+        # Each range gets a single begin / end remove from the model
+        # and therefore a single re-filter from each of the proxy models
+        these_ranges = row_ranges(rows)
+
+        # Too many scattered ranges are cheaper to handle as a reset
+        if len(these_ranges) > self.prune_reset_threshold:
+            self.reset_without_rows(set(rows))
+            return
+
+        for range_start, range_end in reversed(these_ranges):
+            self.libraryModel.removeRows(range_start, range_end - range_start + 1)
+
+    def reset_without_rows(self, rows):
+        # All items are taken out of the model and everything that is to be
+        # kept is put back in a single insertion. The row signals in between
+        # are blocked, and the whole thing is wrapped in a model reset so
+        # that the proxy models and persistent indexes start over.
+        # The hash index is rebuilt on modelReset, once the rows are back.
+        self.libraryModel.beginResetModel()
+
+        retained_items = []
+        self.libraryModel.blockSignals(True)
+        for i in reversed(range(self.libraryModel.rowCount())):
+            this_row = self.libraryModel.takeRow(i)
+            if i not in rows:
+                retained_items.append(this_row[0])
+        retained_items.reverse()
+        self.libraryModel.invisibleRootItem().appendRows(retained_items)
+        self.libraryModel.blockSignals(False)
+
+        self.invalidate_sort_ranks()
+        self.libraryModel.endResetModel()
+
+
+def row_ranges(rows):
+    # [(first, last), ...] of contiguous rows, in ascending order
+    rows = sorted(set(rows))
+    ranges = []
+    range_start = range_end = rows[0]
+    for i in rows[1:]:
+        if i == range_end + 1:
+            range_end = i
+        else:
+            ranges.append((range_start, range_end))
+            range_start = range_end = i
+    ranges.append((range_start, range_end))
+
+    return ranges
+
+
+def collation_key(text):
+    # Goes by the collation rules of the current locale
+    # The C locale doesn't have any, so accents are set aside there
+    # and only used to break ties. Case is ignored, and numbers are
+    # compared as numbers so that "Part 9" comes before "Part 10"
+    text = text.casefold()
+    tie_breaker = None
+    if locale.setlocale(locale.LC_COLLATE).split('.')[0] in ('C', 'POSIX'):
+        tie_breaker = text
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(i for i in text if not unicodedata.combining(i))
+
+    text_parts = re.split(r'(\d+)', text)
+    text_key = tuple(
+        int(j) if i % 2 else locale.strxfrm(j)
+        for i, j in enumerate(text_parts))
+    return text_key, tie_breaker
 
 
 def generate_position_percentage(position):
@@ -50,11 +50,15 @@ class ItemProxyModel(QtCore.QSortFilterProxyModel):
         self.filter_text = None
         self.active_library_filters = None
         self.sorting_box_position = None
+        self.duplicate_hashes = None  # Only these are shown if set
         self.common_functions = ProxyModelsCommonFunctions(self)
 
-    def setFilterParams(self, filter_text, active_library_filters, sorting_box_position):
+    def setFilterParams(
+            self, filter_text, active_library_filters,
+            sorting_box_position, duplicate_hashes=None):
         self.common_functions.setFilterParams(
-            filter_text, active_library_filters, sorting_box_position)
+            filter_text, active_library_filters,
+            sorting_box_position, duplicate_hashes)
 
     def filterAcceptsRow(self, row, parent):
         output = self.common_functions.filterAcceptsRow(row, parent)
@@ -62,7 +66,7 @@ class ItemProxyModel(QtCore.QSortFilterProxyModel):
 
 
 class TableProxyModel(QtCore.QSortFilterProxyModel):
-    def __init__(self, temp_dir, tableViewHeader, consider_read_at, parent=None):
+    def __init__(self, tableViewHeader, consider_read_at, parent=None):
         super(TableProxyModel, self).__init__(parent)
         self.tableViewHeader = tableViewHeader
         self.consider_read_at = consider_read_at
@@ -77,10 +81,10 @@ class TableProxyModel(QtCore.QSortFilterProxyModel):
             None, title_string, author_string,
             year_string, lastread_string, '%', tags_string]
 
-        self.temp_dir = temp_dir
         self.filter_text = None
         self.active_library_filters = None
         self.sorting_box_position = None
+        self.duplicate_hashes = None  # Only these are shown if set
         self.role_dictionary = {
             1: QtCore.Qt.UserRole,      # Title
             2: QtCore.Qt.UserRole + 1,  # Author
@@ -88,8 +92,69 @@ class TableProxyModel(QtCore.QSortFilterProxyModel):
             4: QtCore.Qt.UserRole + 12, # Last read
             5: QtCore.Qt.UserRole + 7,  # Position percentage
             6: QtCore.Qt.UserRole + 4}  # Tags
+
+        # Columns are sorted on the integer ranks generated by the Library
+        # Tags are sorted as they are
+        self.sort_role_dictionary = {
+            1: QtCore.Qt.UserRole + 14, # Title
+            2: QtCore.Qt.UserRole + 15, # Author
+            3: QtCore.Qt.UserRole + 16, # Year
+            4: QtCore.Qt.UserRole + 18, # Last read
+            5: QtCore.Qt.UserRole + 19, # Position percentage
+            6: QtCore.Qt.UserRole + 4}  # Tags
         self.common_functions = ProxyModelsCommonFunctions(self)
 
+        # Formatted strings and pixmaps are cached per source row
+        # Qt calls data() several times per visible cell on every repaint
+        # and the cache only goes stale when the underlying row changes
+        # or when the clock moves the Last Read column along
+        self.cached_roles = (
+            QtCore.Qt.DisplayRole,
+            QtCore.Qt.EditRole,
+            QtCore.Qt.DecorationRole)
+        self.display_cache = {}
+
+        # Last Read is displayed at a granularity of a minute
+        self.clock_timer = QtCore.QTimer(self)
+        self.clock_timer.timeout.connect(self.clock_tick)
+        self.clock_timer.start(60000)
+
+    def setSourceModel(self, model):
+        old_model = self.sourceModel()
+        if old_model:
+            old_model.dataChanged.disconnect(self.invalidate_cached_rows)
+            for i in (old_model.rowsInserted, old_model.rowsRemoved,
+                      old_model.rowsMoved, old_model.modelReset,
+                      old_model.layoutChanged):
+                i.disconnect(self.clear_display_cache)
+
+        self.display_cache.clear()
+        QtCore.QSortFilterProxyModel.setSourceModel(self, model)
+
+        # Rows shift around on insertion and removal, so everything goes
+        model.dataChanged.connect(self.invalidate_cached_rows)
+        for i in (model.rowsInserted, model.rowsRemoved,
+                  model.rowsMoved, model.modelReset,
+                  model.layoutChanged):
+            i.connect(self.clear_display_cache)
+
+    def invalidate_cached_rows(self, top_left, bottom_right, roles=None):
+        for i in range(top_left.row(), bottom_right.row() + 1):
+            self.display_cache.pop(i, None)
+
+    def clear_display_cache(self, *args):
+        self.display_cache.clear()
+
+    def clock_tick(self):
+        for i in self.display_cache.values():
+            i.pop((4, QtCore.Qt.DisplayRole), None)
+            i.pop((4, QtCore.Qt.EditRole), None)
+
+        row_count = self.rowCount()
+        if row_count:
+            self.dataChanged.emit(
+                self.index(0, 4), self.index(row_count - 1, 4))
+
     def columnCount(self, parent):
         return 7
 
@@ -109,6 +174,25 @@ class TableProxyModel(QtCore.QSortFilterProxyModel):
         return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
 
     def data(self, index, role):
+        if role not in self.cached_roles:
+            return self.generate_data(index, role)
+
+        source_row = self.mapToSource(index).row()
+        cache_key = (index.column(), role)
+        try:
+            return self.display_cache[source_row][cache_key]
+        except KeyError:
+            pass
+
+        return_data = self.generate_data(index, role)
+        try:
+            self.display_cache[source_row][cache_key] = return_data
+        except KeyError:
+            self.display_cache[source_row] = {cache_key: return_data}
+
+        return return_data
+
+    def generate_data(self, index, role):
         source_index = self.mapToSource(index)
         item = self.sourceModel().item(source_index.row(), 0)
 
@@ -125,12 +209,11 @@ class TableProxyModel(QtCore.QSortFilterProxyModel):
 
                 if not file_exists:
                     return pie_chart.pixmapper(
-                        -1, None, None, QtCore.Qt.SizeHintRole + 10)
+                        -1, None, QtCore.Qt.SizeHintRole + 10)
 
                 if position_percent:
                     return_pixmap = pie_chart.pixmapper(
-                        position_percent, self.temp_dir,
-                        self.consider_read_at,
+                        position_percent, self.consider_read_at,
                         QtCore.Qt.SizeHintRole + 10)
 
                 return return_pixmap
@@ -150,9 +233,12 @@ class TableProxyModel(QtCore.QSortFilterProxyModel):
         else:
             return QtCore.QVariant()
 
-    def setFilterParams(self, filter_text, active_library_filters, sorting_box_position):
+    def setFilterParams(
+            self, filter_text, active_library_filters,
+            sorting_box_position, duplicate_hashes=None):
         self.common_functions.setFilterParams(
-            filter_text, active_library_filters, sorting_box_position)
+            filter_text, active_library_filters,
+            sorting_box_position, duplicate_hashes)
 
     def filterAcceptsRow(self, row, parent):
         output = self.common_functions.filterAcceptsRow(row, parent)
@@ -164,7 +250,7 @@ class TableProxyModel(QtCore.QSortFilterProxyModel):
 
         self.sort(0, sorting_order)
         if column != 0:
-            self.setSortRole(self.role_dictionary[column])
+            self.setSortRole(self.sort_role_dictionary[column])
 
     def time_convert(self, seconds):
         seconds = int(seconds)
@@ -185,10 +271,13 @@ class ProxyModelsCommonFunctions:
     def __init__(self, parent_model):
         self.parent_model = parent_model
 
-    def setFilterParams(self, filter_text, active_library_filters, sorting_box_position):
+    def setFilterParams(
+            self, filter_text, active_library_filters,
+            sorting_box_position, duplicate_hashes):
         self.parent_model.filter_text = filter_text
         self.parent_model.active_library_filters = [i.lower() for i in active_library_filters]
         self.parent_model.sorting_box_position = sorting_box_position
+        self.parent_model.duplicate_hashes = duplicate_hashes
 
     def filterAcceptsRow(self, row, parent):
         model = self.parent_model.sourceModel()
@@ -204,6 +293,11 @@ class ProxyModelsCommonFunctions:
         last_accessed = model.data(this_index, QtCore.Qt.UserRole + 12)
         file_path = model.data(this_index, QtCore.Qt.UserRole + 13)
 
+        if self.parent_model.duplicate_hashes is not None:
+            book_hash = model.data(this_index, QtCore.Qt.UserRole + 6)
+            if book_hash not in self.parent_model.duplicate_hashes:
+                return False
+
         # Hide untouched files when sorting by last accessed
         if self.parent_model.sorting_box_position == 4 and not last_accessed:
             return False
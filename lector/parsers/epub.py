@@ -17,8 +17,6 @@
 # TODO
 # Maybe also include book description
 
-import os
-import zipfile
 import logging
 
 from lector.readers.read_epub import EPUB
@@ -30,27 +28,22 @@ class ParseEPUB:
     def __init__(self, filename, temp_dir, file_md5):
         self.book = None
         self.filename = filename
-        self.temp_dir = temp_dir
-        self.extract_path = os.path.join(temp_dir, file_md5)
 
     def read_book(self):
-        self.book = EPUB(self.filename, self.temp_dir)
+        self.book = EPUB(self.filename)
 
     def generate_metadata(self):
         self.book.generate_metadata()
         return self.book.metadata
 
     def generate_content(self):
-        zipfile.ZipFile(self.filename).extractall(self.extract_path)
-
         self.book.generate_toc()
         self.book.generate_content()
 
         toc = []
-        content = []
         for count, i in enumerate(self.book.content):
             toc.append((i[0], i[1], count + 1))
-            content.append(i[2])
+        content = self.book.generate_chapters()
 
         # Return toc, content, images_only
         return toc, content, False
@@ -14,17 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-# TODO
-# See if it's possible to just feed the
-# unzipped mobi7 file into the EPUB parser module
-
 import os
 import sys
-import shutil
-import zipfile
 import logging
 
 from lector.readers.read_epub import EPUB
+from lector.KindleUnpack import unipath
 import lector.KindleUnpack.kindleunpack as KindleUnpack
 
 logger = logging.getLogger(__name__)
@@ -32,47 +27,44 @@ logger = logging.getLogger(__name__)
 
 class ParseMOBI:
     # This module parses Amazon ebooks using KindleUnpack to first create an
-    # epub and then read the usual way
+    # epub and then read the usual way. KindleUnpack's output is kept in
+    # memory and the epub never makes it to disk.
 
     def __init__(self, filename, temp_dir, file_md5):
         self.book = None
         self.filename = filename
-        self.epub_filepath = None
-        self.temp_dir = temp_dir
         self.extract_path = os.path.join(temp_dir, file_md5)
 
     def read_book(self):
-        with HidePrinting():
-            KindleUnpack.unpackBook(self.filename, self.extract_path)
-
+        memory_fs = unipath.mount_memory(self.extract_path)
+        try:
+            with HidePrinting():
+                KindleUnpack.unpackBook(self.filename, self.extract_path)
+        finally:
+            unipath.unmount_memory(memory_fs)
+
+        # mobi7 books aren't made into an epub by KindleUnpack
         epub_filename = os.path.splitext(
             os.path.basename(self.filename))[0] + '.epub'
-        self.epub_filepath = os.path.join(
-            self.extract_path, 'mobi8', epub_filename)
+        try:
+            epub_data = memory_fs.files['mobi8/' + epub_filename]
+        except KeyError:
+            epub_data = memory_fs.makezip('mobi7')
 
-        if not os.path.exists(self.epub_filepath):
-            zip_dir = os.path.join(self.extract_path, 'mobi7')
-            zip_file = os.path.join(
-                self.extract_path, epub_filename)
-            self.epub_filepath = shutil.make_archive(zip_file, 'zip', zip_dir)
-
-        self.book = EPUB(self.epub_filepath, self.temp_dir)
+        self.book = EPUB(self.filename, epub_data)
 
     def generate_metadata(self):
         self.book.generate_metadata()
         return self.book.metadata
 
     def generate_content(self):
-        zipfile.ZipFile(self.epub_filepath).extractall(self.extract_path)
-
         self.book.generate_toc()
         self.book.generate_content()
 
         toc = []
-        content = []
         for count, i in enumerate(self.book.content):
             toc.append((1, i[1], count + 1))
-            content.append(i[2])
+        content = self.book.generate_chapters()
 
         # Return toc, content, images_only
         return toc, content, False
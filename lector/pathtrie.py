@@ -0,0 +1,77 @@
+# This file is a part of Lector, a Qt based ebook reader
+# Copyright (C) 2017-2019 BasioMeusPuga
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+
+class PathTrie:
+    # Maps directory paths to arbitrary values
+    # Paths are broken up into their components and a lookup
+    # walks down the trie once, instead of comparing a path
+    # against every single directory that has been inserted
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.is_terminal = False
+
+    @staticmethod
+    def split_path(path):
+        # Empty components are discarded so that the filesystem
+        # root corresponds to the root of the trie
+        return [i for i in os.path.normpath(path).split(os.sep) if i]
+
+    def insert(self, path, value=True):
+        this_node = self
+        for i in self.split_path(path):
+            try:
+                this_node = this_node.children[i]
+            except KeyError:
+                new_node = PathTrie()
+                this_node.children[i] = new_node
+                this_node = new_node
+
+        this_node.value = value
+        this_node.is_terminal = True
+
+    def longest_prefix(self, path):
+        # Returns the value of the deepest inserted directory that
+        # either is the path, or contains it. None otherwise.
+        return_value = self.value
+        this_node = self
+        for i in self.split_path(path):
+            try:
+                this_node = this_node.children[i]
+            except KeyError:
+                break
+            if this_node.is_terminal:
+                return_value = this_node.value
+
+        return return_value
+
+    def has_prefix(self, path):
+        if self.is_terminal:
+            return True
+
+        this_node = self
+        for i in self.split_path(path):
+            try:
+                this_node = this_node.children[i]
+            except KeyError:
+                return False
+            if this_node.is_terminal:
+                return True
+
+        return False
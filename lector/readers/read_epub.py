@@ -18,29 +18,264 @@
 # See if inserting chapters not in the toc.ncx can be avoided
 # Account for stylesheets... eventually
 
+import io
 import os
+import re
+import html
+import posixpath
 import zipfile
 import logging
+import threading
 import collections
-from urllib.parse import unquote
+import collections.abc
+from urllib.parse import quote, unquote
 
+import lxml.html
 import xmltodict
-from PyQt5 import QtGui
-from bs4 import BeautifulSoup
+from lxml import etree
 
 logger = logging.getLogger(__name__)
 
+# Markup that never shows up on the page
+HIDDEN_MARKUP = re.compile(
+    r'<(head|style|script)[\s>].*?</\1\s*>|<!--.*?-->', re.S | re.I)
+HIDDEN_MARKUP_OPEN = re.compile(r'<(?:head|style|script)[\s>]|<!--', re.I)
+VISIBLE_ELEMENT = re.compile(r'<(?:img|image|svg|object|video|audio)[\s/>]', re.I)
+MARKUP_TAG = re.compile(r'<[^>]*>')
+
+# A chapter is a file in the book, an anchor delimited
+# part of a file, or markup of its own (cover, errors)
+Chapter = collections.namedtuple('Chapter', ['file', 'anchor', 'markup'])
+
+
+def open_archive(book_filename, book_data=None):
+    # Books converted to EPUB in memory are never written to disk
+    if book_data:
+        return zipfile.ZipFile(
+            io.BytesIO(book_data), mode='r', allowZip64=True)
+    return zipfile.ZipFile(
+        book_filename, mode='r', allowZip64=True)
+
+
+def normalize_archive_path(path):
+    # Get rid of special characters, backslashes and dot segments
+    path = posixpath.normpath(unquote(path).replace('\\', '/'))
+    return path.lstrip('/')
+
+
+def markup_has_content(markup):
+    # Works on partial markup too: Whatever comes after
+    # an unterminated tag or head is not counted
+    markup = HIDDEN_MARKUP.sub('', markup)
+    markup = HIDDEN_MARKUP_OPEN.split(markup, maxsplit=1)[0]
+    if markup.rfind('<') > markup.rfind('>'):
+        markup = markup[:markup.rfind('<')]
+
+    if VISIBLE_ELEMENT.search(markup):
+        return True
+    return MARKUP_TAG.sub('', markup).strip() != ''
+
+
+def split_chapter(chapter_content, split_anchors):
+    # The chapter is walked through once in document order. Every anchor
+    # closes whatever elements are open at that point, and opens them
+    # again for the markup that follows. Parts of the tree that contain
+    # no anchors are serialized wholesale.
+    try:
+        root = lxml.html.document_fromstring(chapter_content)
+    except (etree.ParserError, ValueError):
+        return {'top_level': chapter_content.decode(errors='replace')}
+
+    wanted_anchors = set(split_anchors)
+    anchor_elements = {}  # Element: anchor
+    for i in root.iterfind('.//*[@id]'):
+        this_anchor = i.get('id')
+        if this_anchor in wanted_anchors:
+            # Only the first element with an id counts
+            wanted_anchors.remove(this_anchor)
+            anchor_elements[i] = this_anchor
+
+    # Anchors that aren't found will show up as parse errors
+    anchor_ancestors = set()
+    for i in anchor_elements:
+        anchor_ancestors.update(i.iterancestors())
+
+    def start_tag(element):
+        attributes = ''.join(
+            f' {j}="{html.escape(k)}"' for j, k in element.attrib.items())
+        return f'<{element.tag}{attributes}>'
+
+    split_content = [['top_level', []]]
+    open_elements = []
+
+    def walker(element):
+        if element in anchor_elements:
+            this_markup = split_content[-1][1]
+            this_markup.extend(
+                f'</{j.tag}>' for j in reversed(open_elements))
+            split_content.append([
+                anchor_elements[element],
+                [start_tag(j) for j in open_elements]])
+
+        this_markup = split_content[-1][1]
+        if element in anchor_ancestors:
+            this_markup.append(start_tag(element))
+            this_markup.append(html.escape(element.text or ''))
+
+            open_elements.append(element)
+            for j in element:
+                walker(j)
+            open_elements.pop()
+
+            # The anchors below may have started a new part
+            this_markup = split_content[-1][1]
+            this_markup.append(f'</{element.tag}>')
+        else:
+            this_markup.append(etree.tostring(
+                element, method='html', encoding='unicode', with_tail=False))
+
+        this_markup.append(html.escape(element.tail or ''))
+
+    walker(root)
+    return {i[0]: ''.join(i[1]) for i in split_content}
+
+
+class ArchiveIndex:
+    # Maps whatever a book calls its files to their names in the archive
+    # In case of clashes, the first file in the archive wins
+    def __init__(self, file_list):
+        self.archive_paths = {}  # Raw or normalized path: archive name
+        self.archive_basenames = {}  # Basename: archive name
+
+        for i in file_list:
+            self.archive_paths.setdefault(i, i)
+            self.archive_paths.setdefault(normalize_archive_path(i), i)
+            self.archive_basenames.setdefault(posixpath.basename(i), i)
+
+    def find(self, filename, base_directory=''):
+        if not filename:
+            return None
+
+        # First, look for the file where it's supposed to be
+        # Then in the root of the book
+        normalized_filename = normalize_archive_path(filename)
+        for i in (
+                normalize_archive_path(
+                    posixpath.join(base_directory, normalized_filename)),
+                filename,
+                normalized_filename):
+            try:
+                return self.archive_paths[i]
+            except KeyError:
+                pass
+
+        # Then search for it elsewhere
+        try:
+            return self.archive_basenames[
+                posixpath.basename(normalized_filename)]
+        except KeyError:
+            return None
+
+
+class EPUBChapters(collections.abc.Sequence):
+    # Stands in for the list of chapter markup
+    # Chapters are read out of the book only when they're asked for
+    # and only the last few files to be read are kept around.
+    # This is pickled across to the main process without any markup
+    # Images and such are also read from here on demand
+    def __init__(
+            self, book_filename, chapters, split_anchors,
+            archive_index, book_data=None, cache_size=4):
+        self.book_filename = book_filename
+        self.book_data = book_data
+        self.chapters = chapters
+        self.split_anchors = split_anchors
+        self.archive_index = archive_index
+        self.cache_size = cache_size
+
+        self.zip_file = None
+        self.cache = collections.OrderedDict()  # File: markup or split markup
+        self.lock = threading.Lock()  # Text search reads from its own thread
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['zip_file'] = None
+        state['cache'] = collections.OrderedDict()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def __getitem__(self, index):
+        this_chapter = self.chapters[index]
+        if this_chapter.file is None:
+            return this_chapter.markup
+
+        with self.lock:
+            try:
+                file_content = self.cache[this_chapter.file]
+                self.cache.move_to_end(this_chapter.file)
+            except KeyError:
+                file_content = self.read_file(this_chapter.file)
+                self.cache[this_chapter.file] = file_content
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        if this_chapter.anchor is None:
+            return file_content
+
+        try:
+            return file_content[this_chapter.anchor]
+        except KeyError:
+            logger.error(
+                f'Error parsing {self.book_filename}: {this_chapter.file}')
+            return 'Parse Error'
+
+    def find_resource(self, chapter_index, resource_name):
+        # Resources are relative to the chapter they're in
+        this_chapter = self.chapters[chapter_index]
+        base_directory = ''
+        if this_chapter.file:
+            base_directory = posixpath.dirname(this_chapter.file)
+
+        return self.archive_index.find(resource_name, base_directory)
+
+    def read_resource(self, resource_file):
+        with self.lock:
+            return self.read_archive(resource_file)
+
+    def read_archive(self, archive_file):
+        if not self.zip_file:
+            self.zip_file = open_archive(self.book_filename, self.book_data)
+        return self.zip_file.read(archive_file)
+
+    def read_file(self, chapter_file):
+        chapter_content = self.read_archive(chapter_file)
+        try:
+            return split_chapter(
+                chapter_content, self.split_anchors[chapter_file])
+        except KeyError:
+            return chapter_content.decode(errors='replace')
+
 
 class EPUB:
-    def __init__(self, book_filename, temp_dir):
+    def __init__(self, book_filename, book_data=None):
         self.book_filename = book_filename
-        self.temp_dir = temp_dir
+        self.book_data = book_data
 
         self.zip_file = None
         self.file_list = None
+        self.archive_index = None
+        self.opf_directory = ''
         self.opf_dict = None
         self.cover_image_name = None
-        self.split_chapters = {}
+        self.cover_image_path = None
+        self.split_anchors = {}
 
         self.metadata = None
         self.content = []
@@ -48,10 +283,12 @@ class EPUB:
         self.generate_references()
 
     def generate_references(self):
-        self.zip_file = zipfile.ZipFile(
-            self.book_filename, mode='r', allowZip64=True)
+        self.zip_file = open_archive(self.book_filename, self.book_data)
         self.file_list = self.zip_file.namelist()
 
+        # Everything is looked up through this
+        self.archive_index = ArchiveIndex(self.file_list)
+
         # Book structure relies on parsing the .opf file
         # in the book. Now that might be the usual content.opf
         # or package.opf or it might be named after your favorite
@@ -73,23 +310,21 @@ class EPUB:
         packagefile_data = self.zip_file.read(packagefile)
         self.opf_dict = xmltodict.parse(packagefile_data)
 
-    def find_file(self, filename):
-        # Get rid of special characters
-        filename = unquote(filename)
+        # Everything in the opf is relative to it
+        self.opf_directory = posixpath.dirname(packagefile)
 
-        # First, look for the file in the root of the book
-        if filename in self.file_list:
-            return filename
+    def find_file(self, filename, base_directory=None):
+        # hrefs are relative to the opf unless
+        # some other base_directory is specified
+        if base_directory is None:
+            base_directory = self.opf_directory
 
-        # Then search for it elsewhere
-        else:
-            file_basename = os.path.basename(filename)
-            for i in self.file_list:
-                if os.path.basename(i) == file_basename:
-                    return i
+        this_file = self.archive_index.find(filename, base_directory)
+        if this_file:
+            return this_file
 
         # If the file isn't found
-        logger.warning(filename + ' not found in ' + self.book_filename)
+        logger.warning(f'{filename} not found in {self.book_filename}')
         return False
 
     def generate_toc(self):
@@ -167,51 +402,31 @@ class EPUB:
             if 'navPoint' in top_level_nav.keys():
                 recursor(1, top_level_nav)
 
-    def get_chapter_content(self, chapter_file):
-        this_file = self.find_file(chapter_file)
-        if this_file:
-            chapter_content = self.zip_file.read(this_file).decode()
-
-            # Generate a None return for a blank chapter
-            # These will be removed from the contents later
-            contentDocument = QtGui.QTextDocument(None)
-            contentDocument.setHtml(chapter_content)
-            contentText = contentDocument.toPlainText().replace('\n', '')
-            if contentText == '':
-                chapter_content = None
-
-            return chapter_content
-        else:
-            return 'Possible parse error: ' + chapter_file
-
-    def parse_split_chapters(self, chapters_with_split_content):
-        # For split chapters, get the whole chapter first, then split
-        # between ids using their anchors, then "heal" the resultant text
-        # by creating a BeautifulSoup object. Write its str to the content
-        for i in chapters_with_split_content.items():
-            chapter_file = i[0]
-            self.split_chapters[chapter_file] = {}
-
-            chapter_content = self.get_chapter_content(chapter_file)
-            soup = BeautifulSoup(chapter_content, 'lxml')
-
-            split_anchors = i[1]
-            for this_anchor in reversed(split_anchors):
-                this_tag = soup.find(
-                    attrs={"id":lambda x: x == this_anchor})
-
-                markup_split = str(soup).split(str(this_tag))
-                soup = BeautifulSoup(markup_split[0], 'lxml')
-
-                # If the tag is None, it probably means the content is overlapping
-                # Skipping the insert is the way forward
-                if this_tag:
-                    this_markup = BeautifulSoup(
-                        str(this_tag).strip() + markup_split[1], 'lxml')
-                    self.split_chapters[chapter_file][this_anchor] = str(this_markup)
-
-            # Remaining markup is assigned here
-            self.split_chapters[chapter_file]['top_level'] = str(soup)
+        # Chapters in the toc are relative to it
+        # They're swapped out for their names in the archive here
+        toc_directory = posixpath.dirname(tocfile)
+        for i in self.content:
+            this_split = i[2].split('#', 1)
+            chapter_file = self.find_file(this_split[0], toc_directory)
+            if chapter_file:
+                this_split[0] = chapter_file
+                i[2] = '#'.join(this_split)
+
+    def chapter_has_content(self, chapter_file):
+        # Blank chapters tend to be a few hundred bytes of markup
+        # and chapters with something in them show it early on,
+        # so reading stops as soon as there's anything to display
+        chapter_markup = b''
+        with self.zip_file.open(chapter_file) as this_chapter:
+            while True:
+                this_chunk = this_chapter.read(16384)
+                if not this_chunk:
+                    return markup_has_content(
+                        chapter_markup.decode(errors='ignore'))
+
+                chapter_markup += this_chunk
+                if markup_has_content(chapter_markup.decode(errors='ignore')):
+                    return True
 
     def generate_content(self):
         # Find all the chapters mentioned in the opf spine
@@ -240,12 +455,14 @@ class EPUB:
         spine_final = []
         for i in chapters_in_spine:
             try:
-                spine_final.append(chapters_from_manifest.pop(i))
+                chapter_file = self.find_file(chapters_from_manifest.pop(i))
             except KeyError:
-                pass
+                continue
+            if chapter_file:
+                spine_final.append(chapter_file)
 
         toc_chapters = [
-            unquote(i[2].split('#')[0]) for i in self.content]
+            i[2].split('#')[0] for i in self.content]
 
         for i in spine_final:
             if not i in toc_chapters:
@@ -261,64 +478,49 @@ class EPUB:
                 self.content.insert(
                     previous_chapter_toc_index + 1, [1, None, i])
 
-        # Parse split chapters as below
-        # They can be picked up during the iteration through the toc
-        chapters_with_split_content = {}
+        # Split chapters are noted here and split when they're
+        # first read. They can be picked up during the iteration through the toc
         for i in self.content:
             if '#' in i[2]:
                 this_split = i[2].split('#')
-                chapter = this_split[0]
+                chapter = self.find_file(this_split[0])
                 anchor = this_split[1]
 
-                try:
-                    chapters_with_split_content[chapter].append(anchor)
-                except KeyError:
-                    chapters_with_split_content[chapter] = []
-                    chapters_with_split_content[chapter].append(anchor)
-
-        self.parse_split_chapters(chapters_with_split_content)
+                if chapter:
+                    try:
+                        self.split_anchors[chapter].append(anchor)
+                    except KeyError:
+                        self.split_anchors[chapter] = [anchor]
 
         # Now we iterate over the ToC as presented in the toc.ncx
-        # and add chapters to the content list
-        # In case a split chapter is encountered, get its content
-        # from the split_chapters dictionary
+        # and note which part of the book each chapter comes from
+        # Nothing but blank chapters is read here
         # What could possibly go wrong?
-        toc_copy = self.content[:]
+        for count, i in enumerate(self.content):
+            this_split = i[2].split('#')
+            chapter_file = self.find_file(this_split[0])
 
-        # Put the book into the book
-        for count, i in enumerate(toc_copy):
-            chapter_file = i[2]
+            if not chapter_file:
+                chapter = Chapter(
+                    None, None, 'Possible parse error: ' + this_split[0])
 
             # Get split content according to its corresponding id attribute
-            if '#' in chapter_file:
-                this_split = chapter_file.split('#')
-                chapter_file_proper = this_split[0]
-                this_anchor = this_split[1]
-
-                try:
-                    chapter_content = (
-                        self.split_chapters[chapter_file_proper][this_anchor])
-                except KeyError:
-                    chapter_content = 'Parse Error'
-                    error_string = (
-                        f'Error parsing {self.book_filename}: {chapter_file_proper}')
-                    logger.error(error_string)
+            elif len(this_split) > 1:
+                chapter = Chapter(chapter_file, this_split[1], None)
 
             # Get content that remained at the end of the pillaging above
-            elif chapter_file in self.split_chapters.keys():
-                try:
-                    chapter_content = self.split_chapters[chapter_file]['top_level']
-                except KeyError:
-                    chapter_content = 'Parse Error'
-                    error_string = (
-                        f'Error parsing {self.book_filename}: {chapter_file}')
-                    logger.error(error_string)
+            elif chapter_file in self.split_anchors:
+                chapter = Chapter(chapter_file, 'top_level', None)
 
             # Vanilla non split chapters
+            # These will be removed from the contents later if blank
+            elif self.chapter_has_content(chapter_file):
+                chapter = Chapter(chapter_file, None, None)
+
             else:
-                chapter_content = self.get_chapter_content(chapter_file)
+                chapter = None
 
-            self.content[count][2] = chapter_content
+            self.content[count][2] = chapter
 
         # Cleanup content by removing null chapters
         unnamed_chapter_title = 1
@@ -340,30 +542,41 @@ class EPUB:
         cover_image = self.generate_book_cover()
 
         if cover_image:
-            cover_path = os.path.join(
-                self.temp_dir, os.path.basename(self.book_filename)) + ' - cover'
-            with open(cover_path, 'wb') as cover_temp:
-                cover_temp.write(cover_image)
-
             # This is probably stupid, but I can't stand the idea of
             # having to look at two book covers
+            first_chapter = EPUBChapters(
+                self.book_filename, [self.content[0][2]],
+                self.split_anchors, self.archive_index, self.book_data)
+            first_chapter.zip_file = self.zip_file
+            first_chapter_content = first_chapter[0].lower()
+
             cover_replacement_conditions = (
-                self.cover_image_name.lower() + '.jpg' in self.content[0][2].lower(),
-                self.cover_image_name.lower() + '.png' in self.content[0][2].lower(),
+                self.cover_image_name.lower() + '.jpg' in first_chapter_content,
+                self.cover_image_name.lower() + '.png' in first_chapter_content,
                 'cover' in self.content[0][1].lower())
 
+            # The cover is served from the archive like any other image
+            cover_path = html.escape(quote(self.cover_image_path))
+            cover_chapter = Chapter(
+                None, None,
+                f'<center><img src="{cover_path}" alt="Cover"></center>')
+
             if True in cover_replacement_conditions:
                 logger.info(
                     f'Replacing cover {cover_replacement_conditions}: {self.book_filename}')
-                self.content[0] = (
-                    1, 'Cover',
-                    f'<center><img src="{cover_path}" alt="Cover"></center>')
+                self.content[0] = (1, 'Cover', cover_chapter)
             else:
                 logger.info('Adding cover: ' + self.book_filename)
-                self.content.insert(
-                    0,
-                    (1, 'Cover',
-                     f'<center><img src="{cover_path}" alt="Cover"></center>'))
+                self.content.insert(0, (1, 'Cover', cover_chapter))
+
+    def generate_chapters(self):
+        # Returns the lazy stand in for chapter markup
+        return EPUBChapters(
+            self.book_filename,
+            [i[2] for i in self.content],
+            self.split_anchors,
+            self.archive_index,
+            self.book_data)
 
     def generate_metadata(self):
         book_metadata = self.opf_dict['package']['metadata']
@@ -450,7 +663,8 @@ class EPUB:
                 i['@href'] for i in self.opf_dict['package']['manifest']['item']
                 if i['@media-type'].split('/')[0] == 'image' and
                 'cover' in i['@id']][0]
-            book_cover = self.zip_file.read(self.find_file(cover_image))
+            cover_image = self.find_file(cover_image)
+            book_cover = self.zip_file.read(cover_image)
         except:
             logger.warning('Cover not found in opf: ' + self.book_filename)
 
@@ -465,8 +679,7 @@ class EPUB:
                         biggest_image_size = j.file_size
 
             if cover_image:
-                book_cover = self.zip_file.read(
-                    self.find_file(cover_image))
+                book_cover = self.zip_file.read(cover_image)
 
         if not book_cover:
             self.cover_image_name = ''
@@ -474,5 +687,6 @@ class EPUB:
         else:
             self.cover_image_name = os.path.splitext(
                 os.path.basename(cover_image))[0]
+            self.cover_image_path = cover_image
 
         return book_cover
@@ -15,21 +15,38 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import copy
 import base64
+import contextlib
 import zipfile
 import logging
 import collections
 
-from bs4 import BeautifulSoup
+from lxml import etree
 
 logger = logging.getLogger(__name__)
 
 
+def local_name(this_name):
+    # Namespaces aren't of any use past this point
+    return this_name.rpartition('}')[2]
+
+
+def strip_namespaces(element):
+    for i in element.iter():
+        if not isinstance(i.tag, str):  # Comments, etc.
+            continue
+        i.tag = local_name(i.tag)
+        for j in i.attrib.keys():
+            if j.startswith('{'):
+                i.attrib[local_name(j)] = i.attrib.pop(j)
+
+
 class FB2:
     def __init__(self, filename):
         self.filename = filename
-        self.zip_file = None
-        self.xml = None
+        self.book_member = None
+        self.cover_image_id = None
 
         self.metadata = None
         self.content = []
@@ -37,140 +54,204 @@ class FB2:
         self.generate_references()
 
     def generate_references(self):
+        # The book itself is streamed in every time it's needed
+        # Only the name of the .fb2 inside a .fb2.zip is found here
         if self.filename.endswith('.fb2.zip'):
-            this_book = zipfile.ZipFile(
-                self.filename, mode='r', allowZip64=True)
-            for i in this_book.filelist:
-                if os.path.splitext(i.filename)[1] == '.fb2':
-                    book_text = this_book.read(i.filename)
-                    break
+            with zipfile.ZipFile(
+                    self.filename, mode='r', allowZip64=True) as book_zip:
+                for i in book_zip.filelist:
+                    if os.path.splitext(i.filename)[1] == '.fb2':
+                        self.book_member = i.filename
+                        break
 
-        else:
-            with open(self.filename, 'r') as book_file:
-                book_text = book_file.read()
+    def stream_elements(self):
+        # Yields the description, top level sections, and binaries once
+        # each of them has been parsed in its entirety. Everything is
+        # discarded as soon as it's been dealt with, so memory use
+        # stays flat regardless of the size of the book.
+        # The archive is only held open while this is being iterated over
+        with contextlib.ExitStack() as open_files:
+            if self.filename.endswith('.fb2.zip'):
+                book_zip = open_files.enter_context(zipfile.ZipFile(
+                    self.filename, mode='r', allowZip64=True))
+                book_file = open_files.enter_context(
+                    book_zip.open(self.book_member))
+            else:
+                book_file = open_files.enter_context(open(self.filename, 'rb'))
+
+            for _, element in etree.iterparse(
+                    book_file, events=('end',), huge_tree=True, recover=True):
+                if not isinstance(element.tag, str):
+                    continue
 
-        self.xml = BeautifulSoup(book_text, 'lxml')
+                this_tag = local_name(element.tag)
+                parent = element.getparent()
+                if this_tag == 'section':
+                    if local_name(parent.tag) != 'body':
+                        continue
+                elif this_tag not in ('description', 'binary'):
+                    continue
+
+                yield this_tag, element
+
+                element.clear()
+                if parent is not None:
+                    parent.remove(element)
 
     def generate_metadata(self):
+        for this_tag, element in self.stream_elements():
+            if this_tag == 'description':
+                self.parse_description(element)
+                # Nothing else is required without a cover
+                if not self.cover_image_id:
+                    break
+
+            if this_tag == 'binary' and element.get('id') == self.cover_image_id:
+                self.metadata = self.metadata._replace(
+                    cover=decode_binary(element))
+                break
+
+        if not self.metadata.cover:
+            logger.warning('Cover not found: ' + self.filename)
+
+    def parse_description(self, element):
         # All metadata can be parsed in one pass
-        all_tags = self.xml.find('description')
+        strip_namespaces(element)
 
-        title = all_tags.find('book-title').text
+        def get_text(tag, separator=''):
+            try:
+                return separator.join(element.find('.//' + tag).itertext()).strip()
+            except AttributeError:
+                return None
+
+        title = get_text('book-title')
         if title == '' or title is None:
             title = os.path.splitext(
                 os.path.basename(self.filename))[0]
 
-        author = all_tags.find(
-            'author').getText(separator=' ').replace('\n', ' ')
+        author = get_text('author', ' ')
         if author == '' or author is None:
             author = '<Unknown>'
         else:
-            author = author.strip()
+            author = ' '.join(author.split())
 
         # TODO
         # Account for other date formats
         try:
-            year = int(all_tags.find('date').text)
-        except ValueError:
+            year = int(get_text('date'))
+        except (TypeError, ValueError):
             year = 9999
 
         isbn = None
         tags = None
 
-        cover = self.generate_book_cover()
+        try:
+            cover_image = element.find('.//coverpage/image')
+            self.cover_image_id = cover_image.get('href').lstrip('#')
+        except AttributeError:
+            pass
 
         Metadata = collections.namedtuple(
             'Metadata', ['title', 'author', 'year', 'isbn', 'tags', 'cover'])
-        self.metadata = Metadata(title, author, year, isbn, tags, cover)
+        self.metadata = Metadata(title, author, year, isbn, tags, None)
 
     def generate_content(self, temp_dir):
-        # TODO
-        # Check what's up with recursion levels
-        # Why is the TypeError happening in get_title
+        # Images are referenced by id throughout the book and the binaries
+        # come last. The files they'll be written to are decided on as the
+        # references turn up, and only the binaries in this table are kept.
+        image_paths = {}  # Image id: file path
+        first_body = None
 
         def get_title(element):
             this_title = '<No title>'
-            title_xml = '<No title xml>'
-            try:
-                for i in element:
-                    if i.name == 'title':
-                        this_title = i.getText(separator=' ')
-                        this_title = this_title.replace('\n', '').strip()
-                        title_xml = str(i.unwrap())
-                        break
-            except TypeError:
-                return None, None
-            return this_title, title_xml
+            for i in element:
+                if i.tag == 'title':
+                    this_title = ' '.join(i.itertext())
+                    this_title = ' '.join(this_title.split())
+                    break
+            return this_title
+
+        def to_html(element):
+            # Copied out of the book so that it no longer
+            # declares the namespaces it used to be in
+            element = copy.deepcopy(element)
+            etree.cleanup_namespaces(element)
+
+            for i in element.iter('image', 'title'):
+                if i.tag == 'title':
+                    i.tag = 'div'
+                    continue
+
+                image_id = i.get('href', '').lstrip('#')
+                image_path = os.path.join(temp_dir, image_id)
+                image_paths[image_id] = image_path
+
+                i.addprevious(etree.Element('p'))
+                i.tag = 'img'
+                i.attrib.clear()
+                i.set('src', image_path)
+
+            return etree.tostring(
+                element, method='html', encoding='unicode', with_tail=False)
 
         def recursor(level, element):
-            children = element.findChildren('section', recursive=False)
+            children = element.findall('section')
             if not children and level != 1:
-                this_title, title_xml = get_title(element)
+                this_title = get_title(element)
                 self.content.append(
-                    [level, this_title, title_xml + str(element)])
+                    [level, this_title, to_html(element)])
             else:
                 for i in children:
                     recursor(level + 1, i)
 
-        first_element = self.xml.find('section')  # Recursive find
-        siblings = list(first_element.findNextSiblings('section', recursive=False))
-        siblings.insert(0, first_element)
-
-        for this_element in siblings:
-            this_title, title_xml = get_title(this_element)
-            # Do not add chapter content in case it has sections
-            # inside it. This prevents having large Book sections that
-            # have duplicated content
-            section_children = this_element.findChildren('section')
-            chapter_text = str(this_element)
-            if section_children:
-                chapter_text = this_title
-
-            self.content.append([1, this_title, chapter_text])
-            recursor(1, this_element)
-
-        # Extract all images to the temp_dir
-        for i in self.xml.find_all('binary'):
-            image_name = i.get('id')
-            image_path = os.path.join(temp_dir, image_name)
-            image_string = f'<image l:href="#{image_name}"'
-            replacement_string = f'<p></p><img src=\"{image_path}\"'
-
-            for j in self.content:
-                j[2] = j[2].replace(
-                    image_string, replacement_string)
-            try:
-                image_data = base64.decodebytes(i.text.encode())
+        for this_tag, element in self.stream_elements():
+            if this_tag == 'description':
+                self.parse_description(element)
+                if self.cover_image_id:
+                    image_paths[self.cover_image_id] = os.path.join(
+                        temp_dir, self.cover_image_id)
+
+            # Only sections in the first body are part of the text
+            # Others are usually notes
+            elif this_tag == 'section':
+                if first_body is None:
+                    first_body = element.getparent()
+                if element.getparent() is not first_body:
+                    continue
+
+                strip_namespaces(element)
+                this_title = get_title(element)
+
+                # Do not add chapter content in case it has sections
+                # inside it. This prevents having large Book sections that
+                # have duplicated content
+                if element.find('section') is not None:
+                    self.content.append([1, this_title, this_title])
+                    recursor(1, element)
+                else:
+                    self.content.append([1, this_title, to_html(element)])
+
+            # Write images to the temp_dir as they stream past
+            elif this_tag == 'binary':
+                try:
+                    image_path = image_paths[element.get('id')]
+                except KeyError:
+                    continue
+
+                image_data = decode_binary(element)
+                if not image_data:
+                    continue
                 with open(image_path, 'wb') as outimage:
                     outimage.write(image_data)
-            except AttributeError:
-                pass
 
-        # Insert the book cover at the beginning
-        cover_image = self.generate_book_cover()
-        if cover_image:
-            cover_path = os.path.join(
-                temp_dir, os.path.basename(self.filename)) + ' - cover'
-            with open(cover_path, 'wb') as cover_temp:
-                cover_temp.write(cover_image)
+                # Insert the book cover at the beginning
+                if element.get('id') == self.cover_image_id:
+                    self.content.insert(
+                        0, (1, 'Cover', f'<center><img src="{image_path}" alt="Cover"></center>'))
 
-            self.content.insert(
-                0, (1, 'Cover', f'<center><img src="{cover_path}" alt="Cover"></center>'))
-
-    def generate_book_cover(self):
-        cover = None
-
-        try:
-            cover_image_xml = self.xml.find('coverpage')
-            for i in cover_image_xml:
-                cover_image_name = i.get('l:href')
-
-            cover_image_data = self.xml.find_all('binary')
-            for i in cover_image_data:
-                if cover_image_name.endswith(i.get('id')):
-                    cover = base64.decodebytes(i.text.encode())
-        except (AttributeError, TypeError):
-            # Catch TypeError in case no images exist in the book
-            logger.warning('Cover not found: ' + self.filename)
 
-        return cover
+def decode_binary(element):
+    try:
+        return base64.b64decode(element.text)
+    except (TypeError, ValueError):
+        return None
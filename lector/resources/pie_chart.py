@@ -1,12 +1,16 @@
 # Modified from: http://drumcoder.co.uk/blog/2010/nov/16/python-code-generate-svg-pie-chart/
 
-import os
 import math
 
-from PyQt5 import QtGui
+from PyQt5 import QtCore, QtGui, QtSvg, QtWidgets
 
+# Rendered emblems are keyed by
+# (quantized progress / state, emblem size, device pixel ratio)
+# Quantizing to whole percentages keeps this at most ~100 entries per size
+_emblem_cache = {}
 
-def generate_pie(progress_percent, temp_dir=None):
+
+def generate_pie(progress_percent):
     progress_percent = int(progress_percent)
 
     lSlices = (progress_percent, 100 - progress_percent)  # percentages to show in pie
@@ -84,37 +88,59 @@ def generate_pie(progress_percent, temp_dir=None):
     </svg>
     """ % (lSvgPath, lOffsetX, lOffsetY)
 
-
-    if temp_dir:
-        svg_path = os.path.join(temp_dir, 'lector_progress.svg')
-        lFile = open(svg_path, 'w')
-        lFile.write(lSvg)
-        lFile.close()
-    else:
-        return lSvg
+    return lSvg
 
 
-def pixmapper(position_percent, temp_dir, consider_read_at, size):
-    # A current_chapter of -1 implies the files does not exist
-    # position_percent and consider_read_at are expected as a <1 decimal value
+def pixmapper(position_percent, consider_read_at, size, device_pixel_ratio=None):
+    # A position_percent of -1 implies the files does not exist
+    # position_percent is expected as a <1 decimal value
+    # consider_read_at is expected as a percentage
 
-    return_pixmap = None
-    consider_read_at = consider_read_at / 100
+    # Nothing here touches the disk. Emblems are rendered in memory
+    # once and handed out from the cache for every subsequent paint.
+    if not device_pixel_ratio:
+        device_pixel_ratio = QtWidgets.qApp.devicePixelRatio()
 
     if position_percent == -1:
-        return_pixmap = QtGui.QIcon(':/images/error.svg').pixmap(size)
-        return return_pixmap
-
-    if position_percent >= consider_read_at:  # Consider book read @ this progress
-        return_pixmap = QtGui.QIcon(':/images/checkmark.svg').pixmap(size)
+        emblem_key = 'error'
+    elif position_percent >= consider_read_at / 100:  # Consider book read @ this progress
+        emblem_key = 'read'
+    else:
+        emblem_key = int(position_percent * 100)
+
+    cache_key = (emblem_key, size, device_pixel_ratio)
+    try:
+        return _emblem_cache[cache_key]
+    except KeyError:
+        pass
+
+    if emblem_key == 'error':
+        renderer = QtSvg.QSvgRenderer(':/images/error.svg')
+    elif emblem_key == 'read':
+        renderer = QtSvg.QSvgRenderer(':/images/checkmark.svg')
     else:
+        renderer = QtSvg.QSvgRenderer(
+            QtCore.QByteArray(generate_pie(emblem_key).encode()))
+        size -= 4  # The -4 looks more proportional
+
+    return_pixmap = render_emblem(renderer, size, device_pixel_ratio)
+    _emblem_cache[cache_key] = return_pixmap
+    return return_pixmap
+
+
+def render_emblem(renderer, size, device_pixel_ratio):
+    # Mimics what QIcon.pixmap() does for an svg: Fit the default
+    # size into a size x size box while retaining the aspect ratio
+    emblem_size = renderer.defaultSize()
+    emblem_size.scale(size, size, QtCore.Qt.KeepAspectRatio)
 
-        # TODO
-        # See if saving the svg to disk can be avoided
-        # Maybe make the alignment a little more uniform across emblems
+    return_pixmap = QtGui.QPixmap(emblem_size * device_pixel_ratio)
+    return_pixmap.setDevicePixelRatio(device_pixel_ratio)
+    return_pixmap.fill(QtCore.Qt.transparent)
 
-        generate_pie(int(position_percent * 100), temp_dir)
-        svg_path = os.path.join(temp_dir, 'lector_progress.svg')
-        return_pixmap = QtGui.QIcon(svg_path).pixmap(size - 4)  ## The -4 looks more proportional
+    painter = QtGui.QPainter(return_pixmap)
+    renderer.render(
+        painter, QtCore.QRectF(0, 0, emblem_size.width(), emblem_size.height()))
+    painter.end()
 
     return return_pixmap
@@ -87,6 +87,9 @@ class Ui_Dialog(object):
         self.refreshLibrary = QtWidgets.QCheckBox(self.groupBox)
         self.refreshLibrary.setObjectName("refreshLibrary")
         self.horizontalLayout_4.addWidget(self.refreshLibrary)
+        self.watchLibrary = QtWidgets.QCheckBox(self.groupBox)
+        self.watchLibrary.setObjectName("watchLibrary")
+        self.horizontalLayout_4.addWidget(self.watchLibrary)
         self.fileRemember = QtWidgets.QCheckBox(self.groupBox)
         self.fileRemember.setObjectName("fileRemember")
         self.horizontalLayout_4.addWidget(self.fileRemember)
@@ -384,6 +387,7 @@ class Ui_Dialog(object):
         self.lightIconsRadio.setToolTip(_translate("Dialog", "Restart application to see changes"))
         self.lightIconsRadio.setText(_translate("Dialog", "L&ight"))
         self.refreshLibrary.setText(_translate("Dialog", "Startup: Refresh library"))
+        self.watchLibrary.setText(_translate("Dialog", "Watch library folders"))
         self.fileRemember.setText(_translate("Dialog", "Remember open files"))
         self.coverShadows.setText(_translate("Dialog", "Cover shadows"))
         self.performCulling.setToolTip(_translate("Dialog", "Enabling reduces startup time and memory usage"))
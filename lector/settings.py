@@ -112,6 +112,8 @@ class Settings:
             'autoTags', 'True').capitalize())
         self.parent.settings['scan_library'] = literal_eval(self.settings.value(
             'scanLibraryAtStart', 'False').capitalize())
+        self.parent.settings['watch_library'] = literal_eval(self.settings.value(
+            'watchLibrary', 'True').capitalize())
         self.parent.settings['remember_files'] = literal_eval(self.settings.value(
             'rememberFiles', 'True').capitalize())
         self.parent.settings['perform_culling'] = literal_eval(self.settings.value(
@@ -212,6 +214,7 @@ class Settings:
         self.settings.setValue('coverShadows', str(current_settings['cover_shadows']))
         self.settings.setValue('autoTags', str(current_settings['auto_tags']))
         self.settings.setValue('scanLibraryAtStart', str(current_settings['scan_library']))
+        self.settings.setValue('watchLibrary', str(current_settings['watch_library']))
         self.settings.setValue('performCulling', str(current_settings['perform_culling']))
         self.settings.setValue('dictionaryLanguage', str(current_settings['dictionary_language']))
         self.settings.setValue('cachingEnabled', str(current_settings['caching_enabled']))
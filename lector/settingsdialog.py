@@ -63,6 +63,7 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
 
         self.paths = None
         self.thread = None
+        self.search_thread = None
         self.filesystemModel = None
         self.tag_data_copy = None
 
@@ -98,6 +99,7 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
         self.autoTags.setChecked(self.main_window.settings['auto_tags'])
         self.coverShadows.setChecked(self.main_window.settings['cover_shadows'])
         self.refreshLibrary.setChecked(self.main_window.settings['scan_library'])
+        self.watchLibrary.setChecked(self.main_window.settings['watch_library'])
         self.fileRemember.setChecked(self.main_window.settings['remember_files'])
         self.performCulling.setChecked(self.main_window.settings['perform_culling'])
         self.cachingEnabled.setChecked(self.main_window.settings['caching_enabled'])
@@ -113,6 +115,7 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
         self.autoTags.clicked.connect(self.manage_checkboxes)
         self.coverShadows.clicked.connect(self.manage_checkboxes)
         self.refreshLibrary.clicked.connect(self.manage_checkboxes)
+        self.watchLibrary.clicked.connect(self.manage_checkboxes)
         self.fileRemember.clicked.connect(self.manage_checkboxes)
         self.performCulling.clicked.connect(self.manage_checkboxes)
         self.cachingEnabled.clicked.connect(self.manage_checkboxes)
@@ -312,6 +315,7 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
 
             database.DatabaseFunctions(
                 self.database_path).delete_from_database('*', '*')
+            self.main_window.library_watcher.watch_directories()
 
             self.main_window.lib_ref.generate_model('build')
             self.main_window.lib_ref.generate_proxymodels()
@@ -332,15 +336,25 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
         # Traverse directories looking for files
         self.main_window.statusMessage.setText(
             self._translate('SettingsUI', 'Checking library folders'))
-        self.thread = BackGroundBookSearch(data_pairs)
-        self.thread.finished.connect(self.finished_iterating)
+        self.search_thread = BackGroundBookSearch(data_pairs, self.database_path)
+        self.search_thread.finished.connect(self.finished_iterating)
+
+        # Changed files are parsed and put into the database
+        # as they're streamed in by the search thread
+        self.thread = BackGroundBookAddition(
+            [], self.database_path, 'automatic',
+            self.main_window, self.search_thread.file_queue)
+        self.thread.prune_all = self.search_thread.full_scan
+        self.thread.present_files = self.search_thread.unsettled_files
+        self.thread.finished.connect(self.finished_scanning)
+
+        self.search_thread.start()
         self.thread.start()
 
     def finished_iterating(self):
         # The books the search thread has found
-        # are now in self.thread.valid_files
-        if not self.thread.valid_files:
-            self.main_window.move_on()
+        # are now in self.search_thread.valid_files
+        if not self.search_thread.changed_snapshots or self.thread.isFinished():
             return
 
         # Hey, messaging is important, okay?
@@ -349,12 +363,19 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
         self.main_window.statusMessage.setText(
             self._translate('SettingsUI', 'Parsing files'))
 
-        # We now create a new thread to put those files into the database
-        self.thread = BackGroundBookAddition(
-            self.thread.valid_files, self.database_path, 'automatic', self.main_window)
-        self.thread.finished.connect(
-            lambda: self.main_window.move_on(self.thread.errors))
-        self.thread.start()
+    def finished_scanning(self):
+        # Snapshots are only saved once every change has been dealt with
+        # Otherwise, an interrupted scan would skip the remaining changes
+        self.search_thread.forget_files(self.thread.failed_files)
+        database.DatabaseFunctions(self.database_path).update_snapshots(
+            self.search_thread.changed_snapshots, self.search_thread.removed_snapshots)
+
+        # Keep an eye on whatever the scan has turned up
+        self.main_window.library_watcher.watch_directories()
+        self.main_window.library_watcher.queue_directories(
+            self.search_thread.unsettled_directories)
+
+        self.main_window.move_on(self.thread.errors)
 
     def cancel_pressed(self):
         self.filesystemModel.tag_data = copy.deepcopy(self.tag_data_copy)
@@ -424,6 +445,7 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
             'coverShadows': 'cover_shadows',
             'autoTags': 'auto_tags',
             'refreshLibrary': 'scan_library',
+            'watchLibrary': 'watch_library',
             'fileRemember': 'remember_files',
             'performCulling': 'perform_culling',
             'cachingEnabled': 'caching_enabled',
@@ -438,6 +460,9 @@ class SettingsUI(QtWidgets.QDialog, settingswindow.Ui_Dialog):
         if not self.performCulling.isChecked():
             self.main_window.cover_functions.load_all_covers()
 
+        if sender == 'watchLibrary':
+            self.main_window.library_watcher.watch_directories()
+
     def generate_annotations(self):
         saved_annotations = self.main_window.settings['annotations']
 
@@ -25,6 +25,7 @@ import io
 import os
 import sys
 import json
+import mmap
 import time
 import pickle
 import logging
@@ -38,7 +39,7 @@ if sys.platform.startswith('win'):
     from multiprocessing.dummy import Pool, Manager
     thread_count = 4  # This is all on one CPU thread anyway
 else:
-    from multiprocessing import Pool, Manager, cpu_count
+    from multiprocessing import Pool, Manager, Process, Pipe, cpu_count
     thread_count = cpu_count()
 
 from PyQt5 import QtCore, QtGui
@@ -86,6 +87,8 @@ else:
 lxml_check = importlib.util.find_spec('lxml')
 xmltodict_check = importlib.util.find_spec('xmltodict')
 if lxml_check and xmltodict_check:
+    import lxml.html
+    from lxml import etree
     from lector.parsers.epub import ParseEPUB
     from lector.parsers.mobi import ParseMOBI
     from lector.parsers.fb2 import ParseFB2
@@ -152,24 +155,55 @@ class BookSorter:
             self.database_hashes()
 
         self.threading_completed = []
-        self.queue = Manager().Queue()
-        self.errors = Manager().list()
+        sync_manager = Manager()
+        self.queue = sync_manager.Queue()
+        self.errors = sync_manager.list()
+        self.failed_files = sync_manager.list()  # Paths that errored out
         self.processed_books = []
 
         if self.work_mode == 'addition':
             progress_object_generator()
 
     def database_hashes(self):
+        # Books are grouped by their prefix hash, which is all that
+        # can be had without reading a file in its entirety
+        # {prefix hash: [[path, hash, content hash], ...]}
         all_hashes_and_paths = database.DatabaseFunctions(
             self.database_path).fetch_data(
-                ('Hash', 'Path'),
+                ('PrefixHash', 'Path', 'Hash', 'ContentHash'),
                 'books',
                 {'Hash': ''},
                 'LIKE')
 
         if all_hashes_and_paths:
-            self.hashes_and_paths = {
-                i[0]: i[1] for i in all_hashes_and_paths}
+            for i in all_hashes_and_paths:
+                try:
+                    self.hashes_and_paths[i[0]].append(i[1:])
+                except KeyError:
+                    self.hashes_and_paths[i[0]] = [i[1:]]
+
+    def resolve_identity(self, filename, prefix_hash):
+        # Returns the hash of the database entry for the file
+        # None in case it isn't in the database
+        try:
+            known_books = self.hashes_and_paths[prefix_hash]
+        except KeyError:
+            return None
+
+        for i in known_books:
+            if i[0] == filename:
+                return i[1]
+
+        if len(known_books) == 1:
+            return known_books[0][1]
+
+        # Books that share a prefix can only be told apart by content
+        file_hash = content_hash(filename)
+        for i in known_books:
+            if file_hash in (i[1], i[2]):
+                return i[1]
+
+        return known_books[0][1]
 
     def database_entry_for_book(self, file_hash):
         database_return = database.DatabaseFunctions(
@@ -197,11 +231,7 @@ class BookSorter:
         # filename is expected as a string containing the
         # full path of the ebook file
 
-        with open(filename, 'rb') as current_book:
-            # This should speed up addition for larger files
-            # without compromising the integrity of the process
-            first_bytes = current_book.read(1024 * 32)  # First 32KB of the file
-            file_md5 = hashlib.md5(first_bytes).hexdigest()
+        prefix_hash, file_size = identify_file(filename)
 
         # Update the progress queue
         self.queue.put(filename)
@@ -211,15 +241,43 @@ class BookSorter:
 
         # Do not allow addition in case the file
         # is already in the database and it remains at its original path
-        if self.work_mode == 'addition' and file_md5 in self.hashes_and_paths:
-            if (self.hashes_and_paths[file_md5] == filename
-                    or os.path.exists(self.hashes_and_paths[file_md5])):
-
-                if not self.hashes_and_paths[file_md5] == filename:
+        # Matching prefixes are confirmed by content before a file is
+        # considered to be a copy of a book elsewhere
+        # New books are identified by their content hash
+        if self.work_mode == 'addition':
+            file_content_hash = None
+            try:
+                known_books = self.hashes_and_paths[prefix_hash]
+            except KeyError:
+                known_books = []
+
+            for i in known_books:
+                if i[0] == filename:
+                    return
+
+            for i in known_books:
+                if not os.path.exists(i[0]):
+                    continue
+
+                if not file_content_hash:
+                    file_content_hash = content_hash(filename)
+                try:
+                    existing_content_hash = i[2] or content_hash(i[0])
+                except OSError:
+                    continue
+
+                if existing_content_hash == file_content_hash:
                     warning_string = (
                         f'{os.path.basename(filename)} is already in database')
                     logger.warning(warning_string)
-                return
+                    return
+
+            if not file_content_hash:
+                file_content_hash = content_hash(filename)
+            file_hash = file_content_hash
+
+        else:
+            file_hash = self.resolve_identity(filename, prefix_hash) or prefix_hash
 
         # This allows for eliminating issues with filenames that have
         # a dot in them. All hail the roundabout fix.
@@ -233,10 +291,11 @@ class BookSorter:
         if not valid_extension:
             this_error = 'Unsupported extension: ' + filename
             self.errors.append(this_error)
+            self.failed_files.append(filename)
             logger.error(this_error)
             return
 
-        book_ref = sorter[file_extension](filename, self.temp_dir, file_md5)
+        book_ref = sorter[file_extension](filename, self.temp_dir, file_hash)
 
         # None of the following have an exception type specified
         # This will keep everything from crashing, but will make
@@ -247,13 +306,15 @@ class BookSorter:
         except Exception as e:
             this_error = f'Error initializing: {filename}'
             self.errors.append(this_error)
+            self.failed_files.append(filename)
             logger.exception(this_error + f' {type(e).__name__} Arguments: {e.args}')
             return
 
         this_book = {}
-        this_book[file_md5] = {
-            'hash': file_md5,
-            'path': filename}
+        this_book[file_hash] = {
+            'hash': file_hash,
+            'path': filename,
+            'size': file_size}
 
         # Different modes require different values
         if self.work_mode == 'addition':
@@ -262,6 +323,7 @@ class BookSorter:
             except Exception as e:
                 this_error = f'Metadata generation error: {filename}'
                 self.errors.append(this_error)
+                self.failed_files.append(filename)
                 logger.exception(this_error + f' {type(e).__name__} Arguments: {e.args}')
                 return
 
@@ -282,8 +344,10 @@ class BookSorter:
                 if self.auto_cover:
                     cover_image = fetch_cover(title, author)
 
-            this_book[file_md5]['cover_image'] = cover_image
-            this_book[file_md5]['addition_mode'] = self.addition_mode
+            this_book[file_hash]['cover_image'] = cover_image
+            this_book[file_hash]['addition_mode'] = self.addition_mode
+            this_book[file_hash]['prefix_hash'] = prefix_hash
+            this_book[file_hash]['content_hash'] = file_content_hash
 
         if self.work_mode == 'reading':
             try:
@@ -291,6 +355,7 @@ class BookSorter:
             except Exception as e:
                 this_error = f'Content generation error: {filename}'
                 self.errors.append(this_error)
+                self.failed_files.append(filename)
                 logger.exception(this_error + f' {type(e).__name__} Arguments: {e.args}')
                 return
 
@@ -299,7 +364,7 @@ class BookSorter:
             images_only = book_breakdown[2]
 
             try:
-                book_data = self.database_entry_for_book(file_md5)
+                book_data = self.database_entry_for_book(file_hash)
             except TypeError:
                 logger.error(
                     f'Database error: {filename}. Re-add book to program')
@@ -315,19 +380,31 @@ class BookSorter:
             cover = book_data[7]
             annotations = book_data[8]
 
-            this_book[file_md5]['position'] = position
-            this_book[file_md5]['bookmarks'] = bookmarks
-            this_book[file_md5]['toc'] = toc
-            this_book[file_md5]['content'] = content
-            this_book[file_md5]['images_only'] = images_only
-            this_book[file_md5]['cover'] = cover
-            this_book[file_md5]['annotations'] = annotations
-
-        this_book[file_md5]['title'] = title
-        this_book[file_md5]['author'] = author
-        this_book[file_md5]['year'] = year
-        this_book[file_md5]['isbn'] = isbn
-        this_book[file_md5]['tags'] = tags
+            # Books that don't have a position yet get one when the tab
+            # is created. Blocks are counted here so that doesn't have to
+            # lay out every chapter on the GUI thread.
+            # Lazily read chapters are read once here, outside the GUI
+            # process. They're counted the first time a book is opened.
+            blocks_per_chapter = None
+            if not images_only and (not position or position['is_read']):
+                blocks_per_chapter = [count_blocks(i) for i in content]
+                if None in blocks_per_chapter:
+                    blocks_per_chapter = None
+
+            this_book[file_hash]['position'] = position
+            this_book[file_hash]['bookmarks'] = bookmarks
+            this_book[file_hash]['toc'] = toc
+            this_book[file_hash]['content'] = content
+            this_book[file_hash]['images_only'] = images_only
+            this_book[file_hash]['cover'] = cover
+            this_book[file_hash]['annotations'] = annotations
+            this_book[file_hash]['blocks_per_chapter'] = blocks_per_chapter
+
+        this_book[file_hash]['title'] = title
+        this_book[file_hash]['author'] = author
+        this_book[file_hash]['year'] = year
+        this_book[file_hash]['isbn'] = isbn
+        this_book[file_hash]['tags'] = tags
 
         return this_book
 
@@ -352,6 +429,14 @@ class BookSorter:
             return None
 
         def pool_creator():
+            # A single book is read in a child process of its own
+            # Unlike pool workers, it is free to spread its parser's
+            # work across processes of its own
+            if len(self.file_list) == 1 and not sys.platform.startswith('win'):
+                self.processed_books = [
+                    read_in_child_process(self.read_book, self.file_list[0])]
+                return
+
             _pool = Pool(thread_count)
             self.processed_books = _pool.map(
                 self.read_book, self.file_list)
@@ -383,6 +468,186 @@ class BookSorter:
         return return_books, self.errors
 
 
+# Elements QTextDocument lays out as blocks
+# Newer additions like section and article are laid out inline
+block_tags = frozenset((
+    'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li',
+    'dl', 'dt', 'dd', 'blockquote', 'pre', 'center', 'address'))
+skipped_tags = frozenset(('head', 'title', 'style', 'script'))
+html_whitespace = ' \t\n\r\f'
+
+
+class BlockCounter:
+    # Follows QTextDocument.setHtml() through an element tree
+    # A block element only starts a new block if the current one has
+    # something in it. Everything except a div also ends its block, so
+    # loose text after it goes into a block of its own.
+    # Every line of a pre is a block, and tables add a block
+    # per cell and one more after themselves.
+    def __init__(self, element):
+        self.blocks = 1
+        self.empty = True  # Nothing has gone into the current block
+        self.closed = False  # The current block takes no more content
+
+        self.add_text(element.text)
+        for i in element:
+            self.add_element(i)
+
+    def new_block(self):
+        if not self.empty:
+            self.blocks += 1
+            self.empty = True
+        self.closed = False
+
+    def add_content(self):
+        if self.closed:
+            self.blocks += 1
+            self.closed = False
+        self.empty = False
+
+    def add_text(self, text):
+        if text and text.strip(html_whitespace):
+            self.add_content()
+
+    def close_block(self):
+        if not self.empty:
+            self.closed = True
+
+    def add_element(self, element):
+        tag = element.tag
+        if not isinstance(tag, str) or tag in skipped_tags:
+            pass  # Comments and such
+
+        elif tag == 'table':
+            # The current block stays in front of the table
+            for i in element.iter('td', 'th'):
+                if next(i.iterancestors('table')) is element:
+                    self.blocks += BlockCounter(i).blocks
+            self.blocks += 1
+            self.empty = False
+            self.closed = False
+
+        elif tag == 'pre':
+            # A newline right after the opening tag
+            # or right before the closing one doesn't count
+            self.new_block()
+            pre_text = ''.join(element.itertext())
+            if pre_text.startswith('\n'):
+                pre_text = pre_text[1:]
+            if pre_text.endswith('\n'):
+                pre_text = pre_text[:-1]
+            if pre_text:
+                self.add_content()
+                self.blocks += pre_text.count('\n')
+                self.close_block()
+
+        elif tag == 'hr':
+            self.new_block()
+            self.empty = False
+            self.close_block()
+
+        elif tag in ('img', 'br'):
+            self.add_content()
+
+        else:
+            is_block = tag in block_tags
+            if is_block:
+                self.new_block()
+
+            self.add_text(element.text)
+            for i in element:
+                self.add_element(i)
+
+            if is_block and tag != 'div':
+                self.close_block()
+
+        self.add_text(element.tail)
+
+
+def count_blocks(chapter_content):
+    # Counts the blocks QTextDocument makes out of a chapter
+    # Positions are measured in these blocks.
+    # Returns None without lxml.
+    if not lxml_check:
+        return None
+
+    if isinstance(chapter_content, str):
+        chapter_content = chapter_content.encode()
+
+    try:
+        root = lxml.html.document_fromstring(chapter_content)
+    except (etree.ParserError, ValueError):
+        return 1
+
+    body = root.find('body')
+    if body is None:
+        body = root
+
+    return BlockCounter(body).blocks
+
+
+# Book identities are versioned
+# Books added earlier are identified by the MD5 of their first 32KB
+# Anything added since is identified by its content hash, which is
+# prefixed with the name of the algorithm. The prefix hash is retained
+# for every book as a cheap first match.
+def identify_file(filename):
+    # Returns the prefix hash of a book, along with its size
+    with open(filename, 'rb') as current_book:
+        # This should speed up addition for larger files
+        # without compromising the integrity of the process
+        first_bytes = current_book.read(1024 * 32)  # First 32KB of the file
+        file_md5 = hashlib.md5(first_bytes).hexdigest()
+        file_size = os.fstat(current_book.fileno()).st_size
+
+    return file_md5, file_size
+
+
+def content_hash(filename):
+    # BLAKE2 of the entire file
+    # The file is mapped into memory instead of being read in chunks
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as current_book:
+        try:
+            with mmap.mmap(
+                    current_book.fileno(), 0, access=mmap.ACCESS_READ) as book_map:
+                file_hash.update(book_map)
+        except ValueError:  # Empty files cannot be mapped
+            pass
+
+    return 'blake2b-' + file_hash.hexdigest()
+
+
+def read_in_child_process(read_function, filename):
+    receiver, sender = Pipe(duplex=False)
+    child_process = Process(
+        target=send_read_result, args=(sender, read_function, filename))
+    child_process.start()
+    sender.close()
+
+    # The result has to be received before the child can exit
+    try:
+        read_result = receiver.recv()
+    except EOFError:
+        logger.error('Reader process exited without a result: ' + filename)
+        read_result = None
+
+    child_process.join()
+    return read_result
+
+
+def send_read_result(sender, read_function, filename):
+    try:
+        read_result = read_function(filename)
+    except Exception as e:
+        logger.exception(
+            f'Error reading: {filename} {type(e).__name__} Arguments: {e.args}')
+        read_result = None
+
+    sender.send(read_result)
+    sender.close()
+
+
 def progress_object_generator():
     # This has to be kept separate from the BookSorter class because
     # the QtObject inheritance disallows pickling
@@ -16,14 +16,16 @@
 
 import os
 import re
+import time
+import queue
 import logging
-import pathlib
-from multiprocessing.dummy import Pool
+import threading
 
 from PyQt5 import QtCore, QtGui
 
 from lector import sorter
 from lector import database
+from lector.pathtrie import PathTrie
 
 # The following have to be separate
 try:
@@ -59,7 +61,16 @@ class BackGroundTabUpdate(QtCore.QThread):
 
 
 class BackGroundBookAddition(QtCore.QThread):
-    def __init__(self, file_list, database_path, addition_mode, main_window, parent=None):
+    # The library model belongs to the GUI thread
+    # Changes to it are handed over as signals
+    books_parsed = QtCore.pyqtSignal(dict)
+    prune_to_paths = QtCore.pyqtSignal(list)
+    prune_paths = QtCore.pyqtSignal(list, dict)
+    books_relinked = QtCore.pyqtSignal(list)
+
+    def __init__(
+            self, file_list, database_path, addition_mode,
+            main_window, file_queue=None, parent=None):
         super(BackGroundBookAddition, self).__init__(parent)
         self.file_list = file_list
         self.database_path = database_path
@@ -67,24 +78,230 @@ class BackGroundBookAddition(QtCore.QThread):
         self.main_window = main_window
         self.errors = []
 
+        lib_ref = self.main_window.lib_ref
+        self.books_parsed.connect(lib_ref.add_parsed_books)
+        self.prune_to_paths.connect(lib_ref.prune_models)
+        self.prune_paths.connect(lib_ref.prune_paths)
+        self.books_relinked.connect(lib_ref.relink_books)
+
+        # Changes may also be streamed in through a queue as
+        # (added, removed, modified) tuples of file lists.
+        # A None signals the end of the stream.
+        self.file_queue = file_queue
+
         self.prune_required = True
         if self.addition_mode == 'manual':
             self.prune_required = False
 
+        # Whether streamed in files are all the files there are
+        # Otherwise, only the changes they describe are pruned
+        self.prune_all = True
+        self.changes_found = False
+
+        # Files that exist, but aren't to be added just yet
+        # Their library entries are kept when pruning everything else
+        self.present_files = []
+
+        # Files that couldn't be parsed
+        self.failed_files = []
+
+        # Size: [[hash, path, prefix hash, content hash], ...]
+        # of every book in the database
+        # Generated once there's something to relink
+        self.relink_candidates = None
+        self.unknown_size_candidates = None
+        self.missing_paths = {}  # Path: True in case the file is gone
+
     def run(self):
+        if self.file_queue is None:
+            self.add_books(self.file_list)
+            if self.prune_required:
+                self.prune_to_paths.emit(self.file_list)
+            return
+
+        self.file_list = []
+        removed_files = []
+        replaced_hashes = {}  # Path: new hash of books modified in place
+
+        end_of_stream = False
+        while not end_of_stream:
+            file_batch = self.file_queue.get()
+            if file_batch is None:
+                break
+            self.changes_found = True
+
+            added_files, removed_batch, modified_files = (
+                list(i) for i in file_batch)
+
+            # Take whatever else has turned up in the meantime
+            while True:
+                try:
+                    next_batch = self.file_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_batch is None:
+                    end_of_stream = True
+                    break
+                added_files.extend(next_batch[0])
+                removed_batch.extend(next_batch[1])
+                modified_files.extend(next_batch[2])
+
+            self.file_list.extend(added_files)
+            removed_files.extend(removed_batch)
+
+            parsed_books = self.add_books(added_files + modified_files)
+            modified_files = set(modified_files)
+            for i in parsed_books.items():
+                if i[1]['path'] in modified_files:
+                    replaced_hashes[i[1]['path']] = i[0]
+
+        if not self.prune_required:
+            return
+
+        if self.prune_all:
+            # Nothing is pruned in case nothing was found
+            if self.file_list:
+                self.prune_to_paths.emit(self.file_list + self.present_files)
+        elif removed_files or replaced_hashes:
+            self.prune_paths.emit(removed_files, replaced_hashes)
+
+    def relink_books(self, file_list):
+        # Books that have been moved are matched to their database entries
+        # by size and hash. Only their paths are updated. Nothing is parsed.
+        # Returns whatever is left over for parsing.
+        if self.relink_candidates is None:
+            all_books = database.DatabaseFunctions(
+                self.database_path).fetch_data(
+                    ('FileSize', 'Hash', 'Path', 'PrefixHash', 'ContentHash'),
+                    'books',
+                    {'Hash': ''},
+                    'LIKE')
+
+            self.relink_candidates = {}
+            for i in all_books or ():
+                try:
+                    self.relink_candidates[i[0]].append(list(i[1:]))
+                except KeyError:
+                    self.relink_candidates[i[0]] = [list(i[1:])]
+
+        # Books without a size on record can match anything
+        # Only the ones that have gone missing are of any use
+        # The rest get their sizes recorded now that they're being looked at
+        if self.unknown_size_candidates is None:
+            self.unknown_size_candidates = []
+            found_sizes = []
+            for i in self.relink_candidates.get(None, ()):
+                try:
+                    found_sizes.append((os.path.getsize(i[1]), i[0]))
+                    self.missing_paths[i[1]] = False
+                except (OSError, TypeError):
+                    self.missing_paths[i[1]] = True
+                    self.unknown_size_candidates.append(i)
+
+            if found_sizes:
+                database.DatabaseFunctions(
+                    self.database_path).assign_file_sizes(found_sizes)
+
+        remaining_files = []
+        relinked_books = []
+        for i in file_list:
+            try:
+                file_size = os.path.getsize(i)
+            except OSError:
+                remaining_files.append(i)
+                continue
+
+            # Books of the same size are tried first, and those
+            # without a size on record only in case none of them match
+            file_hashes = {}
+            for candidates in (
+                    self.relink_candidates.get(file_size),
+                    self.unknown_size_candidates):
+                if not candidates:
+                    continue
+                this_match = self.match_candidates(i, candidates, file_hashes)
+                if this_match:
+                    break
+            else:
+                remaining_files.append(i)
+                continue
+
+            this_match[1] = i
+            self.missing_paths[i] = False
+            relinked_books.append((this_match[0], i, file_size))
+
+        if relinked_books:
+            directory_ids = database.DatabaseFunctions(
+                self.database_path).relink_books(relinked_books)
+            self.books_relinked.emit(
+                [(i[0], i[1], directory_ids[i[0]]) for i in relinked_books])
+
+            logger.info(f'Relinked {len(relinked_books)} moved books')
+
+        return remaining_files
+
+    def is_missing(self, path):
+        # Each path on record is checked once per scan
+        try:
+            return self.missing_paths[path]
+        except KeyError:
+            self.missing_paths[path] = not os.path.exists(path)
+            return self.missing_paths[path]
+
+    def match_candidates(self, filename, candidates, file_hashes):
+        # Returns the candidate whose book has gone missing and matches
+        # the file, None otherwise. Hashes of the file are kept in
+        # file_hashes and only computed once there's a candidate to check.
+        # The content hash is only computed in case there's one on
+        # record to compare against. Legacy entries make do with the prefix.
+        for i in candidates:
+            if i[1] == filename or not self.is_missing(i[1]):
+                continue
+
+            if 'prefix' not in file_hashes:
+                try:
+                    file_hashes['prefix'] = sorter.identify_file(filename)[0]
+                except OSError:
+                    return None
+            if i[2] != file_hashes['prefix']:
+                continue
+
+            if i[3]:
+                if 'content' not in file_hashes:
+                    try:
+                        file_hashes['content'] = sorter.content_hash(filename)
+                    except OSError:
+                        file_hashes['content'] = ''
+                if file_hashes['content'] != i[3]:
+                    continue
+
+            return i
+
+        return None
+
+    def add_books(self, file_list):
+        file_list = self.relink_books(file_list)
+        if not file_list:
+            return {}
+
         books = sorter.BookSorter(
-            self.file_list,
+            file_list,
             ('addition', self.addition_mode),
             self.database_path,
             self.main_window.settings,
             self.main_window.temp_dir.path())
 
-        parsed_books, self.errors = books.initiate_threads()
-        self.main_window.lib_ref.generate_model('addition', parsed_books, False)
+        sorter_return = books.initiate_threads()
+        if not sorter_return:  # None of the files exist anymore
+            return {}
+
+        parsed_books, errors = sorter_return
+        self.errors.extend(errors)
+        self.failed_files.extend(books.failed_files)
+        self.books_parsed.emit(parsed_books)
         database.DatabaseFunctions(self.database_path).add_to_database(parsed_books)
 
-        if self.prune_required:
-            self.main_window.lib_ref.prune_models(self.file_list)
+        return parsed_books
 
 
 class BackGroundBookDeletion(QtCore.QThread):
@@ -98,44 +315,292 @@ class BackGroundBookDeletion(QtCore.QThread):
             self.database_path).delete_from_database('Hash', self.hash_list)
 
 
+class BackGroundFileCheck(QtCore.QThread):
+    # Emits {book_hash: file_exists} dictionaries in batches
+    files_checked = QtCore.pyqtSignal(dict)
+
+    def __init__(self, hashes_and_paths, parent=None):
+        super(BackGroundFileCheck, self).__init__(parent)
+        self.hashes_and_paths = hashes_and_paths
+        self.batch_size = 500
+
+    def run(self):
+        # Files are grouped by their directory and each directory is
+        # listed once. This is a lot kinder to network mounts and
+        # sleeping drives than a stat() call per file.
+        files_by_directory = {}
+        for book_hash, path in self.hashes_and_paths:
+            directory, filename = os.path.split(path)
+            try:
+                files_by_directory[directory].append((book_hash, path, filename))
+            except KeyError:
+                files_by_directory[directory] = [(book_hash, path, filename)]
+
+        results = {}
+        for directory, files in files_by_directory.items():
+            try:
+                with os.scandir(directory) as directory_entries:
+                    present_files = {i.name for i in directory_entries}
+                for book_hash, path, filename in files:
+                    results[book_hash] = filename in present_files
+
+            except PermissionError:
+                # The directory can't be listed, but the files may still be readable
+                for book_hash, path, filename in files:
+                    results[book_hash] = os.path.exists(path)
+
+            except (OSError, UnicodeEncodeError):
+                for book_hash, path, filename in files:
+                    results[book_hash] = False
+
+            if len(results) >= self.batch_size:
+                self.files_checked.emit(results)
+                results = {}
+
+        if results:
+            self.files_checked.emit(results)
+
+
 class BackGroundBookSearch(QtCore.QThread):
-    def __init__(self, data_list, parent=None):
+    def __init__(self, data_list, database_path, target_directories=None, parent=None):
         super(BackGroundBookSearch, self).__init__(parent)
+        self.database_path = database_path
         self.valid_files = []
+        self.thread_count = 8
+
+        # In case target_directories are specified, only they are scanned
+        # along with any new subdirectories they may have
+        self.target_directories = target_directories
+
+        # Changes are put here in batches as they're found
+        # as (added, removed, modified) tuples of file lists
+        # None is put in once the search is complete
+        self.file_queue = queue.Queue()
 
         # Filter for checked directories
         self.valid_directories = [
             [i[0], i[1], i[2]] for i in data_list if i[
                 3] == QtCore.Qt.Checked and os.path.exists(i[0])]
-        self.unwanted_directories = [
-            pathlib.Path(i[0]) for i in data_list if i[3] == QtCore.Qt.Unchecked]
+
+        # Whether a directory is to be searched is decided by the
+        # deepest checked / unchecked directory that contains it
+        self.directory_trie = PathTrie()
+        for i in data_list:
+            self.directory_trie.insert(i[0], i[3] == QtCore.Qt.Checked)
+
+        # Directories are only listed again in case their mtime
+        # has changed since the last scan. Without any previous
+        # scans, every file found is reported as added.
+        # A directory's mtime only changes when entries are added, removed,
+        # or renamed. A file rewritten in place (as opposed to being saved
+        # over by way of a rename) is only noticed once something else
+        # has its directory listed again. Listed files are compared by
+        # mtime and size, so a rewrite that keeps the size within the
+        # same mtime tick goes unnoticed as well.
+        self.snapshots = database.DatabaseFunctions(database_path).fetch_snapshots()
+        self.full_scan = not self.snapshots and not target_directories
+        self.mtime_tolerance = 2 * 10 ** 9  # FAT has a 2 second resolution
+
+        # Files modified this recently may still be in the middle of
+        # being written. They're left alone until they settle.
+        # They still exist though, and are not to be pruned.
+        self.settle_time = 5 * 10 ** 9
+        self.unsettled_directories = []
+        self.unsettled_files = []
+
+        # To be saved once the changes have been dealt with
+        self.changed_snapshots = {}
+        self.removed_snapshots = []
+
+        # Paths of every book in the library
+        # Files that aren't in it are added regardless of snapshots
+        self.library_paths = set()
+
+    def forget_files(self, file_paths):
+        # Files that couldn't be added are left out of the snapshots
+        # Their directories are listed again next time so they're retried
+        for i in file_paths:
+            directory, filename = os.path.split(i)
+            try:
+                snapshot = self.changed_snapshots[directory]
+            except KeyError:
+                continue
+
+            files = {j: k for j, k in snapshot[3].items() if j != filename}
+            self.changed_snapshots[directory] = (
+                snapshot[0], 0, snapshot[2], files)
 
     def run(self):
+        valid_extensions = set(sorter.available_parsers)
+        library_books = database.DatabaseFunctions(
+            self.database_path).fetch_data(
+                ('Path',),
+                'books',
+                {'Path': ''},
+                'LIKE')
+        self.library_paths = set(i[0] for i in library_books or ())
+        scan_time = time.time_ns()
+        directory_queue = queue.Queue()
+        visited_directories = set()
+        removed_subdirectories = PathTrie()
+        scan_lock = threading.Lock()
+
         def is_wanted(directory):
-            directory_parents = pathlib.Path(directory).parents
-            for i in self.unwanted_directories:
-                if i in directory_parents:
-                    return False
-            return True
-
-        def traverse_directory(incoming_data):
-            root_directory = incoming_data[0]
-            for directory, subdirs, files in os.walk(root_directory, topdown=True):
-                # Black magic fuckery
-                # Skip subdir tree in case it's not wanted
-                subdirs[:] = [d for d in subdirs if is_wanted(os.path.join(directory, d))]
-                for filename in files:
-                    if os.path.splitext(filename)[1][1:] in sorter.available_parsers:
-                        self.valid_files.append(os.path.join(directory, filename))
-
-        def initiate_threads():
-            _pool = Pool(5)
-            _pool.map(traverse_directory, self.valid_directories)
-            _pool.close()
-            _pool.join()
-
-        if self.valid_directories:
-            initiate_threads()
+            return self.directory_trie.longest_prefix(directory) is not False
+
+        def list_directory(directory):
+            subdirectories = []
+            files = {}  # Name: (mtime, size)
+            unsettled_files = []
+            with os.scandir(directory) as directory_entries:
+                for this_entry in directory_entries:
+                    try:
+                        if this_entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(this_entry.name)
+                        elif this_entry.is_file():
+                            file_extension = os.path.splitext(this_entry.name)[1][1:]
+                            if file_extension in valid_extensions:
+                                file_stat = this_entry.stat()
+                                if file_stat.st_mtime_ns > scan_time - self.settle_time:
+                                    unsettled_files.append(this_entry.name)
+                                    continue
+                                files[this_entry.name] = (
+                                    file_stat.st_mtime_ns, file_stat.st_size)
+                    except OSError:
+                        continue
+
+            return subdirectories, files, unsettled_files
+
+        def traverse_directory(directory):
+            try:
+                snapshot = self.snapshots[directory]
+            except KeyError:
+                snapshot = None
+
+            try:
+                directory_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                logger.warning('Unable to scan: ' + directory)
+                return
+
+            # Anything changed within the same tick as the previous
+            # listing would have left the mtime as is
+            is_unchanged = (
+                snapshot and snapshot[0] == directory_mtime
+                and directory_mtime < snapshot[1] - self.mtime_tolerance)
+
+            unsettled_files = None
+            if not is_unchanged:
+                try:
+                    subdirectories, files, unsettled_files = list_directory(directory)
+                except OSError:
+                    logger.warning('Unable to scan: ' + directory)
+                    if not snapshot:
+                        return
+                    # Consider everything as it was the last time
+                    is_unchanged = True
+
+            if is_unchanged:
+                subdirectories, files = snapshot[2], snapshot[3]
+                added_files = removed_files = modified_files = []
+            else:
+                previous_files = snapshot[3] if snapshot else {}
+                previous_subdirectories = snapshot[2] if snapshot else ()
+
+                # Files that are still being written to are considered
+                # as they were. The directory is listed again next time.
+                for i in unsettled_files:
+                    try:
+                        files[i] = previous_files[i]
+                    except KeyError:
+                        pass
+
+                added_files = [
+                    os.path.join(directory, i)
+                    for i in files if i not in previous_files]
+                removed_files = [
+                    os.path.join(directory, i)
+                    for i in previous_files if i not in files]
+                modified_files = [
+                    os.path.join(directory, i) for i in files
+                    if i in previous_files and files[i] != previous_files[i]]
+
+            # Books that have been removed from the library, or couldn't be
+            # parsed, are tried again even though nothing about them changed
+            reported_files = set(added_files + modified_files)
+            added_files = added_files + [
+                j for j in (os.path.join(directory, i) for i in files)
+                if j not in self.library_paths and j not in reported_files]
+
+            with scan_lock:
+                visited_directories.add(directory)
+                self.valid_files.extend(
+                    [os.path.join(directory, i) for i in files])
+                if not is_unchanged:
+                    # A scan time of 0 has the directory listed again
+                    listing_time = scan_time
+                    if unsettled_files:
+                        listing_time = 0
+                        self.unsettled_directories.append(directory)
+                        self.unsettled_files.extend(
+                            [os.path.join(directory, i) for i in unsettled_files])
+
+                    self.changed_snapshots[directory] = (
+                        directory_mtime, listing_time, subdirectories, files)
+
+                    for i in previous_subdirectories:
+                        if i not in subdirectories:
+                            removed_subdirectories.insert(os.path.join(directory, i))
+
+            # Skip subdir tree in case it's not wanted
+            # Otherwise, any idle worker may pick it up
+            # Targeted scans only descend into new subdirectories
+            for i in subdirectories:
+                this_subdirectory = os.path.join(directory, i)
+                if self.target_directories and this_subdirectory in self.snapshots:
+                    continue
+                if is_wanted(this_subdirectory):
+                    directory_queue.put(this_subdirectory)
+
+            if added_files or removed_files or modified_files:
+                self.file_queue.put((added_files, removed_files, modified_files))
+
+        def worker():
+            while True:
+                directory = directory_queue.get()
+                if directory is None:
+                    break
+                try:
+                    traverse_directory(directory)
+                except Exception as e:
+                    logger.exception(
+                        f'Error scanning: {directory} {type(e).__name__} Arguments: {e.args}')
+                finally:
+                    directory_queue.task_done()
+
+        if self.target_directories:
+            starting_directories = [
+                i for i in self.target_directories if is_wanted(i)]
+        else:
+            starting_directories = [i[0] for i in self.valid_directories]
+
+        if starting_directories:
+            for i in starting_directories:
+                directory_queue.put(i)
+
+            workers = [
+                threading.Thread(target=worker) for _ in range(self.thread_count)]
+            for i in workers:
+                i.start()
+
+            # Every directory, including the ones found along the way,
+            # has been traversed once this returns
+            directory_queue.join()
+            for i in workers:
+                directory_queue.put(None)
+            for i in workers:
+                i.join()
+
             if self.valid_files:
                 info_string = str(len(self.valid_files)) + ' books found'
                 logger.info(info_string)
@@ -144,6 +609,31 @@ class BackGroundBookSearch(QtCore.QThread):
         else:
             logger.error('No valid directories')
 
+        # Directories that have been deleted or unchecked
+        # take all of their files with them
+        # A targeted scan only knows about the deleted ones
+        removed_files = []
+        for i in self.snapshots.items():
+            if self.target_directories:
+                is_removed = removed_subdirectories.has_prefix(i[0])
+            else:
+                is_removed = i[0] not in visited_directories
+
+            if is_removed:
+                self.removed_snapshots.append(i[0])
+                removed_files.extend(
+                    [os.path.join(i[0], j) for j in i[1][3]])
+        if removed_files:
+            self.file_queue.put(([], removed_files, []))
+
+        info_string = (
+            f'Library scan: {len(visited_directories)} directories, '
+            f'{len(self.changed_snapshots)} changed, '
+            f'{len(self.removed_snapshots)} removed')
+        logger.info(info_string)
+
+        self.file_queue.put(None)
+
 
 class BackGroundCacheRefill(QtCore.QThread):
     def __init__(self, image_cache, remove_value, filetype, book, all_pages, parent=None):
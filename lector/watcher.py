@@ -0,0 +1,148 @@
+# This file is a part of Lector, a Qt based ebook reader
+# Copyright (C) 2017-2019 BasioMeusPuga
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from PyQt5 import QtCore
+
+from lector import database
+from lector.threaded import BackGroundBookSearch, BackGroundBookAddition
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryWatcher(QtCore.QObject):
+    # Keeps the library in sync with its folders while the application runs
+    # Every directory seen by the last library scan is watched. Changes are
+    # collected until things quieten down and then only the directories
+    # they were in are scanned again.
+    def __init__(self, main_window, parent=None):
+        super(LibraryWatcher, self).__init__(parent)
+        self.main_window = main_window
+        self.database_path = self.main_window.database_path
+
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+        self.pending_directories = set()
+
+        # Restarted with every change so that bursts
+        # (copying over a folder, etc.) end up in a single scan
+        self.settle_timer = QtCore.QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(3000)
+        self.settle_timer.timeout.connect(self.start_scan)
+
+        self.search_thread = None
+        self.thread = None
+
+    def watch_directories(self):
+        watched_directories = set(self.watcher.directories())
+
+        if not self.main_window.settings['watch_library']:
+            if watched_directories:
+                self.watcher.removePaths(list(watched_directories))
+            self.pending_directories.clear()
+            self.settle_timer.stop()
+            return
+
+        snapshot_paths = database.DatabaseFunctions(
+            self.database_path).fetch_data(
+                ('Path',),
+                'snapshots',
+                {'Path': ''},
+                'LIKE')
+
+        library_directories = set()
+        if snapshot_paths:
+            library_directories = set(i[0] for i in snapshot_paths)
+
+        stale_directories = watched_directories - library_directories
+        if stale_directories:
+            self.watcher.removePaths(list(stale_directories))
+
+        new_directories = library_directories - watched_directories
+        if new_directories:
+            failed_directories = self.watcher.addPaths(list(new_directories))
+            if failed_directories:
+                logger.warning(
+                    f'Unable to watch {len(failed_directories)} library directories')
+
+    def directory_changed(self, directory):
+        self.queue_directories((directory,))
+
+    def queue_directories(self, directories):
+        if not self.main_window.settings['watch_library'] or not directories:
+            return
+
+        self.pending_directories.update(directories)
+        self.settle_timer.start()
+
+    def is_scanning(self):
+        settings_thread = self.main_window.settingsDialog.thread
+        return ((self.thread and self.thread.isRunning()) or
+                (settings_thread and settings_thread.isRunning()))
+
+    def start_scan(self):
+        if not self.pending_directories:
+            return
+
+        # Try again once the scan in progress is done with
+        if self.is_scanning():
+            self.settle_timer.start()
+            return
+
+        data_pairs = database.DatabaseFunctions(
+            self.database_path).fetch_data(
+                ('Path', 'Name', 'Tags', 'CheckState'),
+                'directories',
+                {'Path': ''},
+                'LIKE')
+        if not data_pairs:
+            self.pending_directories.clear()
+            return
+
+        target_directories = self.pending_directories
+        self.pending_directories = set()
+
+        # Disallow full scans until this one is done
+        self.main_window.settingsDialog.okButton.setEnabled(False)
+        self.main_window.libraryToolBar.reloadLibraryButton.setEnabled(False)
+
+        self.search_thread = BackGroundBookSearch(
+            data_pairs, self.database_path, target_directories)
+        self.thread = BackGroundBookAddition(
+            [], self.database_path, 'automatic',
+            self.main_window, self.search_thread.file_queue)
+        self.thread.prune_all = False
+        self.thread.finished.connect(self.finished_scanning)
+
+        self.search_thread.start()
+        self.thread.start()
+
+    def finished_scanning(self):
+        self.search_thread.forget_files(self.thread.failed_files)
+        database.DatabaseFunctions(self.database_path).update_snapshots(
+            self.search_thread.changed_snapshots, self.search_thread.removed_snapshots)
+        self.watch_directories()
+
+        # Files that were still being written to are picked up later
+        self.queue_directories(self.search_thread.unsettled_directories)
+
+        if self.thread.changes_found:
+            self.main_window.move_on(self.thread.errors)
+        else:
+            self.main_window.settingsDialog.okButton.setEnabled(True)
+            self.main_window.libraryToolBar.reloadLibraryButton.setEnabled(True)
@@ -18,8 +18,8 @@
 # Reading modes
 # Double page, Continuous etc
 
-import os
 import logging
+import itertools
 
 from PyQt5 import QtWidgets, QtGui, QtCore
 
@@ -69,6 +69,11 @@ class Tab(QtWidgets.QWidget):
             self.generate_position()
             current_chapter = 1
 
+        # Positions saved before block offsets were kept
+        if 'block_offsets' not in self.metadata['position']:
+            self.metadata['position']['block_offsets'] = generate_block_offsets(
+                self.metadata['position']['blocks_per_chapter'])
+
         # The content display widget is, by default a QTextBrowser.
         # In case the incoming data is only images
         # such as in the case of comic book files,
@@ -89,22 +94,6 @@ class Tab(QtWidgets.QWidget):
             # Change this when HTML navigation works
             self.contentView.setOpenLinks(False)
 
-            # TODO
-            # Rename the .css files to something else here and keep
-            # a record of them .Currently, I'm just removing them
-            # for the sake of simplicity
-            relative_path_root = os.path.join(
-                self.main_window.temp_dir.path(), self.metadata['hash'])
-            relative_paths = []
-            for i in os.walk(relative_path_root):
-                for j in i[2]:
-                    file_extension = os.path.splitext(j)[1]
-                    if file_extension == '.css':
-                        file_path = os.path.join(i[0], j)
-                        os.remove(file_path)
-                relative_paths.append(os.path.join(relative_path_root, i[0]))
-            self.contentView.setSearchPaths(relative_paths)
-
             self.hiddenButton = QtWidgets.QToolButton(self)
             self.hiddenButton.setVisible(False)
             self.hiddenButton.clicked.connect(self.set_cursor_position)
@@ -228,19 +217,11 @@ class Tab(QtWidgets.QWidget):
     def update_last_accessed_time(self):
         self.metadata['last_accessed'] = QtCore.QDateTime().currentDateTime()
 
-        start_index = self.main_window.lib_ref.libraryModel.index(0, 0)
-        matching_item = self.main_window.lib_ref.libraryModel.match(
-            start_index,
-            QtCore.Qt.UserRole + 6,
+        # Nothing happens in case the file has been deleted
+        self.main_window.lib_ref.queue_book_update(
             self.metadata['hash'],
-            1, QtCore.Qt.MatchExactly)
-
-        try:
-            self.main_window.lib_ref.libraryModel.setData(
-                matching_item[0],
-                self.metadata['last_accessed'], QtCore.Qt.UserRole + 12)
-        except IndexError:  # The file has been deleted
-            pass
+            QtCore.Qt.UserRole + 12,
+            self.metadata['last_accessed'])
 
     def set_cursor_position(self, cursor_position=None, select_chars=0):
         try:
@@ -284,23 +265,25 @@ class Tab(QtWidgets.QWidget):
 
         # Generate block count @ time of first read
         # Blocks are indexed from 0 up
-        blocks_per_chapter = []
-        total_blocks = 0
+        # These are usually counted while the book is parsed
+        blocks_per_chapter = self.metadata['blocks_per_chapter']
+        if not blocks_per_chapter:
+            blocks_per_chapter = []
 
-        if not self.are_we_doing_images_only:
-            for i in self.metadata['content']:
-                textDocument = QtGui.QTextDocument(None)
-                textDocument.setHtml(i)
-                block_count = textDocument.blockCount()
+            if not self.are_we_doing_images_only:
+                for i in self.metadata['content']:
+                    textDocument = QtGui.QTextDocument(None)
+                    textDocument.setHtml(i)
+                    blocks_per_chapter.append(textDocument.blockCount())
 
-                blocks_per_chapter.append(block_count)
-                total_blocks += block_count
+        block_offsets = generate_block_offsets(blocks_per_chapter)
 
         self.metadata['position'] = {
             'current_chapter': current_chapter,
             'total_chapters': total_chapters,
             'blocks_per_chapter': blocks_per_chapter,
-            'total_blocks': total_blocks,
+            'block_offsets': block_offsets,
+            'total_blocks': block_offsets[-1],
             'is_read': is_read,
             'current_block': 0,
             'cursor_position': 0}
@@ -558,6 +541,8 @@ class Tab(QtWidgets.QWidget):
             # Using setViewPortMargins for this disables scrolling in the margins
             block_format.setLeftMargin(padding)
             block_format.setRightMargin(padding)
+            self.contentView.padding = padding
+            self.contentView.rescale_images()
 
             this_cursor = self.contentView.textCursor()
             this_cursor.setPosition(QtGui.QTextCursor.Start)
@@ -608,6 +593,12 @@ class Tab(QtWidgets.QWidget):
         self.main_window.closeEvent()
 
 
+def generate_block_offsets(blocks_per_chapter):
+    # Number of blocks in the book before each chapter
+    # The last one is the total number of blocks
+    return [0] + list(itertools.accumulate(blocks_per_chapter))
+
+
 class PliantQGraphicsScene(QtWidgets.QGraphicsScene):
     def __init__(self, parent=None):
         super(PliantQGraphicsScene, self).__init__(parent)
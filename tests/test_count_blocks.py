@@ -0,0 +1,105 @@
+# This file is a part of Lector, a Qt based ebook reader
+# Copyright (C) 2017-2019 BasioMeusPuga
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Reading positions are measured in QTextDocument blocks, so the counts
+# made while parsing a book have to agree with what setHtml() makes
+# Run with QT_QPA_PLATFORM=offscreen where there's no display
+
+import unittest
+
+from PyQt5 import QtGui, QtWidgets
+
+from lector import sorter
+
+chapter_markup = (
+    # Paragraphs, and loose text around them
+    '<p>a</p><p>b</p>',
+    'loose<p>a</p>tail',
+    '<body>loose text only</body>',
+    '<div>x<p>a</p>y</div>',
+    '<div>a<div>b</div>c<div>d</div>e</div>',
+    '<h2>a</h2>text<br>more',
+    '<p>a<br>b<br/>c</p>',
+    '<span>a</span><span>b</span>',
+    'a<section>b</section>c',
+    '<section><p>a</p></section><article>b</article>',
+
+    # Empty blocks
+    '',
+    '<div></div>',
+    '<p></p><p>  </p>',
+    '<p>&nbsp;</p><p>x</p>',
+    '<div>x</div><div></div><div>y</div>',
+    '<p><img src="x"></p><p></p>',
+    '<p><img src="x"></p><div><img src="x"></div>',
+
+    # Preformatted text
+    '<pre>l1\nl2\nl3</pre>',
+    '<pre>\nl1\n</pre>',
+    '<pre>l1\n\nl2\n</pre>',
+    '<p>x</p><pre>a<b>x\ny</b></pre>c',
+
+    # Lists, quotes and rules
+    '<ul><li>a</li><li>b</li></ul>',
+    '<ul><li></li><li>b<ul><li>c</li></ul></li></ul>',
+    '<ol><li><p>a</p><p>b</p></li></ol>',
+    '<dl><dt>a</dt><dd>b</dd></dl>',
+    '<blockquote><p>a</p><p>b</p></blockquote>',
+    '<center>a</center><address>b</address>',
+    '<h1>t</h1><hr><p>a</p>',
+    '<p>a<hr>b</p>',
+
+    # Tables
+    '<table><tr><td>a</td><td>b</td></tr>'
+    '<tr><td>c</td><td><p>d</p><p>e</p></td></tr></table>',
+    '<table><tr><td></td></tr></table>',
+    '<p>x</p><table><tr><td>a</td></tr></table><p>y</p>',
+    '<table><tr><td>a</td></tr></table>tail',
+    '<table><tr><td><table><tr><td>a</td></tr></table></td></tr></table>',
+
+    # What comes out of an EPUB
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml">'
+    '<head><title>c</title><style>p {}</style></head><body>\n'
+    '<h2 class="x">Chapter 1</h2>\n'
+    '<p class="a">One <i>two</i></p>\n<!-- comment -->\n'
+    '<p class="a">Three</p>\n'
+    '<div class="img"><img src="a.jpg" alt=""/></div>\n'
+    '<blockquote><p>q</p></blockquote>\n'
+    '</body></html>')
+
+
+class CountBlocksTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtWidgets.QApplication.instance()
+        if not cls.app:
+            cls.app = QtWidgets.QApplication([])
+
+    def test_matches_qt(self):
+        if not sorter.lxml_check:
+            self.skipTest('lxml is not installed')
+
+        for i in chapter_markup:
+            textDocument = QtGui.QTextDocument(None)
+            textDocument.setHtml(i)
+            with self.subTest(markup=i):
+                self.assertEqual(
+                    sorter.count_blocks(i), textDocument.blockCount())
+
+
+if __name__ == '__main__':
+    unittest.main()
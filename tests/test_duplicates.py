@@ -0,0 +1,126 @@
+# This file is a part of Lector, a Qt based ebook reader
+# Copyright (C) 2017-2019 BasioMeusPuga
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The library is built out of a database the way it is at startup
+# Run with QT_QPA_PLATFORM=offscreen where there's no display
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from PyQt5 import QtCore, QtWidgets
+
+from lector import database
+from lector.library import Library
+
+# Hash, title, author, ISBN, file name
+library_books = (
+    ('h1', 'Dune', 'Frank Herbert', '0441013597', 'Dune.epub'),
+    ('h2', 'DUNE', 'Herbert, Frank', '978-0-441-01359-3', 'dune.pdf'),
+    ('h3', 'Dune.', 'Frank Herbert', None, 'Dune (1).mobi'),
+    ('h4', 'Dune Messiah', 'Frank Herbert', '0441172695', 'Messiah.epub'),
+    ('h5', 'Emma', 'Jane Austen', None, 'Emma.epub'),
+    ('h6', 'Émma', 'Austen Jane', None, 'Emma.azw3'),
+    ('h7', 'Persuasion', 'Jane Austen', None, 'Persuasion.epub'))
+
+
+class SurplusDuplicatesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtWidgets.QApplication.instance()
+        if not cls.app:
+            cls.app = QtWidgets.QApplication([])
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.library = None
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def build_library(self, books):
+        database_path = self.temp_dir.name
+        database.DatabaseInit(database_path)
+
+        parsed_books = {}
+        for book_hash, title, author, isbn, file_name in books:
+            parsed_books[book_hash] = {
+                'title': title,
+                'author': author,
+                'year': 2000,
+                'path': os.path.join(database_path, file_name),
+                'cover_image': None,
+                'isbn': isbn,
+                'addition_mode': 'manual',
+                'size': 1024,
+                'prefix_hash': book_hash,
+                'content_hash': book_hash,
+                'tags': None}
+        database.DatabaseFunctions(database_path).add_to_database(parsed_books)
+
+        main_window = SimpleNamespace(
+            database_path=database_path,
+            settings={'perform_culling': True})
+        self.library = Library(main_window)
+        self.library.generate_model('build')
+        self.library.file_check_thread.wait()
+
+    def surplus_hashes(self):
+        model = self.library.libraryModel
+        return sorted(
+            (model.data(keep_index, QtCore.Qt.UserRole + 6),
+             sorted(model.data(i, QtCore.Qt.UserRole + 6) for i in surplus_indexes))
+            for keep_index, surplus_indexes in self.library.surplus_duplicates())
+
+    def test_groups(self):
+        # ISBNs are matched across both formats, and titles and
+        # authors regardless of case, accents, punctuation, and word order
+        self.build_library(library_books)
+        self.assertEqual(
+            self.surplus_hashes(),
+            [('h1', ['h2', 'h3']), ('h5', ['h6'])])
+
+    def test_books_being_read_are_kept(self):
+        self.build_library(library_books)
+        model = self.library.libraryModel
+        model.setData(
+            self.library.index_for_hash('h3'), 0.5, QtCore.Qt.UserRole + 7)
+        model.setData(
+            self.library.index_for_hash('h6'), 0.1, QtCore.Qt.UserRole + 7)
+
+        self.assertEqual(
+            self.surplus_hashes(),
+            [('h3', ['h1', 'h2']), ('h6', ['h5'])])
+
+    def test_groups_are_not_merged(self):
+        # Two editions of Emma, each with a copy that shares its ISBN
+        # The title matches all four, but the editions are kept apart
+        # The copy without an ISBN only shares a title, and joins the first group
+        self.build_library((
+            ('h1', 'Emma', 'Jane Austen', '9780141439587', 'Emma.epub'),
+            ('h2', 'Emma', 'Jane Austen', '9780141439587', 'Emma.pdf'),
+            ('h3', 'Emma', 'Jane Austen', '9780199535521', 'Emma (Oxford).epub'),
+            ('h4', 'Emma', 'Jane Austen', '9780199535521', 'Emma (Oxford).mobi'),
+            ('h5', 'Emma', 'Jane Austen', None, 'Emma guide.epub')))
+
+        self.assertEqual(
+            self.surplus_hashes(),
+            [('h1', ['h2', 'h5']), ('h3', ['h4'])])
+
+
+if __name__ == '__main__':
+    unittest.main()